@@ -1,8 +1,31 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django import forms
+from django.db.models import BooleanField, Case, Value, When
 from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from .models import TrafficSign, ManualTrafficSign, Vehicle, ComplianceRecord, RewardToken, Leaderboard
 
+# Pre-built compliance rate badges; the rate is always numeric so it can be
+# interpolated directly without going through format_html's escaping
+_RATE_TEMPLATES = {
+    'green': '<span style="color: green;">%s%%</span>',
+    'orange': '<span style="color: orange;">%s%%</span>',
+    'red': '<span style="color: red;">%s%%</span>',
+}
+
+def compliance_rate_badge(rate):
+    color = 'green' if rate >= 90 else 'orange' if rate >= 70 else 'red'
+    return mark_safe(_RATE_TEMPLATES[color] % rate)
+
+# (sign_value, drive_value) help text per manual sign type
+_SIGN_HELP_TEXTS = {
+    'speed_limit': ("Enter speed limit value (e.g., 40, 60)", "Enter actual speed driven"),
+    'no_horn': ("Enter 'Yes' or 'No' for no horn zone", "Enter 1 if horn was used, 0 if not"),
+    'four_wheeler': ("Enter 'Yes' or 'No' for four wheeler zone", "Enter 1 if four wheeler, 0 if not"),
+    'seatbelt': ("Enter 'Yes' or 'No' for seatbelt required", "Enter 1 if seatbelt worn, 0 if not"),
+}
+
 class ManualTrafficSignForm(forms.ModelForm):
     """Custom form for ManualTrafficSign with vehicle field"""
     
@@ -14,27 +37,34 @@ class ManualTrafficSignForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Add help text based on sign type
         if self.instance and self.instance.sign_type:
-            if self.instance.sign_type == 'speed_limit':
-                self.fields['sign_value'].help_text = "Enter speed limit value (e.g., 40, 60)"
-                self.fields['drive_value'].help_text = "Enter actual speed driven"
-            elif self.instance.sign_type == 'no_horn':
-                self.fields['sign_value'].help_text = "Enter 'Yes' or 'No' for no horn zone"
-                self.fields['drive_value'].help_text = "Enter 1 if horn was used, 0 if not"
-            elif self.instance.sign_type == 'four_wheeler':
-                self.fields['sign_value'].help_text = "Enter 'Yes' or 'No' for four wheeler zone"
-                self.fields['drive_value'].help_text = "Enter 1 if four wheeler, 0 if not"
-            elif self.instance.sign_type == 'seatbelt':
-                self.fields['sign_value'].help_text = "Enter 'Yes' or 'No' for seatbelt required"
-                self.fields['drive_value'].help_text = "Enter 1 if seatbelt worn, 0 if not"
+            help_texts = _SIGN_HELP_TEXTS.get(self.instance.sign_type)
+            if help_texts:
+                self.fields['sign_value'].help_text, self.fields['drive_value'].help_text = help_texts
+
+class LeaderboardChangeList(ChangeList):
+    """Changelist that only loads the columns LeaderboardAdmin displays"""
+    
+    def get_queryset(self, request, *args, **kwargs):
+        return super().get_queryset(request, *args, **kwargs).only(
+            'rank', 'total_trips', 'total_violations', 'compliance_rate', 'last_updated',
+            'vehicle__vehicle_id', 'vehicle__vehicle_type'
+        )
 
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     list_display = ('rank', 'vehicle_id', 'vehicle_type', 'total_trips', 'total_violations', 'compliance_rate', 'qualification_status', 'last_updated')
+    show_full_result_count = False
     list_filter = ('vehicle__vehicle_type', 'last_updated')
     search_fields = ('vehicle__vehicle_id', 'vehicle__owner_name')
     ordering = ('rank',)
     readonly_fields = ('rank', 'total_violations', 'total_trips', 'compliance_rate', 'average_compliance_score', 'total_tokens_earned', 'last_updated')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('vehicle')
+    
+    def get_changelist(self, request, **kwargs):
+        return LeaderboardChangeList
+    
     def vehicle_id(self, obj):
         return obj.vehicle.vehicle_id
     vehicle_id.short_description = 'Vehicle ID'
@@ -44,8 +74,7 @@ class LeaderboardAdmin(admin.ModelAdmin):
     vehicle_type.short_description = 'Vehicle Type'
     
     def compliance_rate(self, obj):
-        color = 'green' if obj.compliance_rate >= 90 else 'orange' if obj.compliance_rate >= 70 else 'red'
-        return format_html('<span style="color: {};">{}%</span>', color, obj.compliance_rate)
+        return compliance_rate_badge(obj.compliance_rate)
     compliance_rate.short_description = 'Compliance Rate'
     
     def qualification_status(self, obj):
@@ -66,7 +95,9 @@ class LeaderboardAdmin(admin.ModelAdmin):
 class ManualTrafficSignAdmin(admin.ModelAdmin):
     form = ManualTrafficSignForm
     list_display = ('vehicle', 'sign_type', 'sign_value', 'drive_value', 'location', 'created_at', 'is_active')
-    list_filter = ('vehicle', 'sign_type', 'is_active', 'created_at')
+    show_full_result_count = False
+    # Only offer vehicles that actually have manual signs, not the whole fleet
+    list_filter = (('vehicle', admin.RelatedOnlyFieldListFilter), 'sign_type', 'is_active', 'created_at')
     search_fields = ('vehicle__vehicle_id', 'vehicle__owner_name', 'sign_type', 'sign_value', 'location')
     ordering = ('-created_at',)
     
@@ -83,6 +114,9 @@ class ManualTrafficSignAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('vehicle')
+    
     def get_display_value(self, obj):
         if obj.sign_type == 'speed_limit':
             return f"{obj.sign_value} km/h" if obj.sign_value else "Not set"
@@ -93,6 +127,7 @@ class ManualTrafficSignAdmin(admin.ModelAdmin):
 @admin.register(TrafficSign)
 class TrafficSignAdmin(admin.ModelAdmin):
     list_display = ('sign_type', 'sign_value', 'detected_at', 'location', 'is_active')
+    show_full_result_count = False
     list_filter = ('sign_type', 'is_active', 'detected_at')
     search_fields = ('sign_type', 'sign_value', 'location')
     ordering = ('-detected_at',)
@@ -100,43 +135,54 @@ class TrafficSignAdmin(admin.ModelAdmin):
 @admin.register(Vehicle)
 class VehicleAdmin(admin.ModelAdmin):
     list_display = ('vehicle_id', 'vehicle_type', 'registration_number', 'owner_name', 'total_trips', 'total_violations', 'compliance_rate', 'leaderboard_qualified', 'created_at')
+    show_full_result_count = False
     list_filter = ('vehicle_type', 'created_at')
     search_fields = ('vehicle_id', 'registration_number', 'owner_name')
     ordering = ('-created_at',)
     readonly_fields = ('compliance_rate', 'total_violations', 'total_trips', 'average_compliance_score', 'qualifies_for_leaderboard')
     
+    def get_queryset(self, request):
+        # Sortable qualification flag computed from the stored trip count
+        return super().get_queryset(request).annotate(
+            qualifies=Case(
+                When(total_trips__gte=3, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            )
+        )
+    
     def compliance_rate(self, obj):
-        color = 'green' if obj.compliance_rate >= 90 else 'orange' if obj.compliance_rate >= 70 else 'red'
-        return format_html('<span style="color: {};">{}%</span>', color, obj.compliance_rate)
+        return compliance_rate_badge(obj.compliance_rate)
     compliance_rate.short_description = 'Compliance Rate'
     
-    def total_violations(self, obj):
-        return obj.total_violations
-    total_violations.short_description = 'Violations'
-    
-    def total_trips(self, obj):
-        return obj.total_trips
-    total_trips.short_description = 'Trips'
-    
     def leaderboard_qualified(self, obj):
-        if obj.qualifies_for_leaderboard:
+        if obj.qualifies:
             return format_html('<span style="color: green;">✓ Qualified</span>')
         else:
             remaining = 3 - obj.total_trips
             return format_html('<span style="color: orange;">Needs {} more entries</span>', remaining)
     leaderboard_qualified.short_description = 'Leaderboard Status'
+    leaderboard_qualified.admin_order_field = 'qualifies'
 
 @admin.register(ComplianceRecord)
 class ComplianceRecordAdmin(admin.ModelAdmin):
     list_display = ('id', 'vehicle', 'traffic_sign', 'violation_type', 'severity', 'compliance_score', 'recorded_at')
+    show_full_result_count = False
     list_filter = ('violation_type', 'severity', 'recorded_at')
     search_fields = ('vehicle__vehicle_id', 'traffic_sign__sign_type')
     ordering = ('-recorded_at',)
     readonly_fields = ('compliance_score',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('vehicle', 'traffic_sign')
 
 @admin.register(RewardToken)
 class RewardTokenAdmin(admin.ModelAdmin):
     list_display = ('vehicle', 'tokens_earned', 'tokens_spent', 'tokens_available', 'last_updated')
+    show_full_result_count = False
     list_filter = ('last_updated',)
     search_fields = ('vehicle__vehicle_id',)
     readonly_fields = ('tokens_available',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('vehicle')
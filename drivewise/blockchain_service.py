@@ -1,31 +1,188 @@
+import functools
 import json
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from typing import Dict, List, Optional
+import requests
 from web3 import Web3
+from web3._utils.encoding import Web3JsonEncoder
 from django.conf import settings
 from django.core.cache import cache
 from .models import Vehicle, ComplianceRecord, Leaderboard, RewardToken
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Rows pulled from the database per round trip
+SYNC_CHUNK_SIZE = 2000
+
+# Vehicles or records packed into each batch transaction, and batch
+# transactions allowed in flight at once
+SYNC_BATCH_SIZE = 100
+SYNC_WORKERS = 4
+
+# Cache key and lifetime (seconds) for the node health check
+CONNECTION_CACHE_KEY = 'blockchain:conn'
+CONNECTION_CACHE_TIMEOUT = 5
+
+# Unconfigured settings values
+_PLACEHOLDER_ADDR = "0x" + "00" * 20
+_PLACEHOLDER_KEY = "0x" + "00" * 32
+
+# Simplified ABI for testing - in production, load from compiled contract
+_CONTRACT_ABI = (
+    {
+        "inputs": [],
+        "stateMutability": "nonpayable",
+        "type": "constructor"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "string",
+                "name": "vehicleId",
+                "type": "string"
+            },
+            {
+                "internalType": "string",
+                "name": "vehicleType",
+                "type": "string"
+            },
+            {
+                "internalType": "string",
+                "name": "ownerName",
+                "type": "string"
+            }
+        ],
+        "name": "registerVehicle",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "string[]",
+                "name": "vehicleIds",
+                "type": "string[]"
+            },
+            {
+                "internalType": "string[]",
+                "name": "vehicleTypes",
+                "type": "string[]"
+            },
+            {
+                "internalType": "string[]",
+                "name": "ownerNames",
+                "type": "string[]"
+            }
+        ],
+        "name": "batchRegisterVehicles",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "string[]",
+                "name": "vehicleIds",
+                "type": "string[]"
+            },
+            {
+                "internalType": "string[]",
+                "name": "violationTypes",
+                "type": "string[]"
+            },
+            {
+                "internalType": "uint256[]",
+                "name": "complianceScores",
+                "type": "uint256[]"
+            },
+            {
+                "internalType": "uint256[]",
+                "name": "recordedAt",
+                "type": "uint256[]"
+            }
+        ],
+        "name": "batchAddComplianceRecords",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+)
+
+
+def _chunked(iterable, size):
+    """Yield lists of up to `size` items from `iterable`"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class OrjsonHTTPProvider(Web3.HTTPProvider):
+    """HTTPProvider that encodes and decodes JSON-RPC payloads with orjson"""
+    
+    _encoder = Web3JsonEncoder()
+    
+    def encode_rpc_request(self, method, params):
+        rpc_dict = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params or [],
+            "id": next(self.request_counter),
+        }
+        return orjson.dumps(rpc_dict, default=self._encoder.default)
+    
+    @staticmethod
+    def decode_rpc_response(raw_response):
+        return orjson.loads(raw_response)
+
+
+def _make_provider(endpoint_uri):
+    """Build an HTTP provider that keeps one pooled session for all RPCs"""
+    provider_class = OrjsonHTTPProvider if orjson is not None else Web3.HTTPProvider
+    return provider_class(endpoint_uri, session=requests.Session())
+
+
+@functools.lru_cache(maxsize=1)
+def _get_contract(web3, address):
+    """Build the contract object once per Web3 connection and address"""
+    return web3.eth.contract(address=address, abi=_CONTRACT_ABI)
+
+
 class BlockchainService:
     def __init__(self):
         self.web3 = None
         self.contract = None
         self.contract_address = None
+        # Whether configuration and contract loading succeeded; decided once
+        # here so per-row checks are a plain attribute read
+        self._enabled = False
+        self._connected = False
+        self._connected_until = 0.0
         self._initialize_web3()
     
     def _initialize_web3(self):
         """Initialize Web3 connection and contract"""
         try:
             # Check if blockchain configuration is properly set
-            if (settings.BLOCKCHAIN_CONTRACT_ADDRESS == '0x0000000000000000000000000000000000000000' or 
-                settings.BLOCKCHAIN_PRIVATE_KEY == '0x0000000000000000000000000000000000000000000000000000000000000000'):
+            if (settings.BLOCKCHAIN_CONTRACT_ADDRESS == _PLACEHOLDER_ADDR or 
+                settings.BLOCKCHAIN_PRIVATE_KEY == _PLACEHOLDER_KEY):
                 logger.warning("Blockchain not properly configured. Using placeholder values.")
                 return
             
             # Initialize Web3
-            self.web3 = Web3(Web3.HTTPProvider(settings.BLOCKCHAIN_NETWORK_URL))
+            self.web3 = Web3(_make_provider(settings.BLOCKCHAIN_NETWORK_URL))
             
             # Check connection
             if not self.web3.is_connected():
@@ -37,6 +194,7 @@ class BlockchainService:
             
             # Load contract ABI (simplified for now)
             self.contract = self._load_contract()
+            self._enabled = self.contract is not None
             
             logger.info("Blockchain service initialized successfully")
             
@@ -48,43 +206,8 @@ class BlockchainService:
     def _load_contract(self):
         """Load the smart contract"""
         try:
-            # Simplified ABI for testing - in production, load from compiled contract
-            contract_abi = [
-                {
-                    "inputs": [],
-                    "stateMutability": "nonpayable",
-                    "type": "constructor"
-                },
-                {
-                    "inputs": [
-                        {
-                            "internalType": "string",
-                            "name": "vehicleId",
-                            "type": "string"
-                        },
-                        {
-                            "internalType": "string",
-                            "name": "vehicleType",
-                            "type": "string"
-                        },
-                        {
-                            "internalType": "string",
-                            "name": "ownerName",
-                            "type": "string"
-                        }
-                    ],
-                    "name": "registerVehicle",
-                    "outputs": [],
-                    "stateMutability": "nonpayable",
-                    "type": "function"
-                }
-            ]
-            
             if self.web3 and self.contract_address:
-                return self.web3.eth.contract(
-                    address=self.contract_address,
-                    abi=contract_abi
-                )
+                return _get_contract(self.web3, self.contract_address)
             return None
             
         except Exception as e:
@@ -93,12 +216,25 @@ class BlockchainService:
     
     def is_connected(self) -> bool:
         """Check if blockchain is connected and configured"""
-        return (self.web3 is not None and 
-                self.contract is not None and 
-                self.web3.is_connected())
+        if not self._enabled:
+            return False
+        
+        # Reuse a recent health check rather than probing the node on every
+        # call: first this instance's own copy, then the shared cache
+        now = time.monotonic()
+        if now < self._connected_until:
+            return self._connected
+        
+        connected = cache.get(CONNECTION_CACHE_KEY)
+        if connected is None:
+            connected = self.web3.is_connected()
+            cache.set(CONNECTION_CACHE_KEY, connected, CONNECTION_CACHE_TIMEOUT)
+        self._connected = connected
+        self._connected_until = now + CONNECTION_CACHE_TIMEOUT
+        return connected
     
     def sync_vehicle_to_blockchain(self, vehicle: Vehicle) -> bool:
-        """Sync vehicle data to blockchain"""
+        """Sync vehicle data to blockchain (a Vehicle or a named values_list row)"""
         if not self.is_connected():
             logger.warning("Blockchain not connected. Skipping vehicle sync.")
             return False
@@ -112,6 +248,26 @@ class BlockchainService:
             logger.error(f"Error syncing vehicle to blockchain: {e}")
             return False
     
+    def sync_vehicles_batch_to_blockchain(self, vehicles: List[Vehicle]) -> int:
+        """Sync a batch of vehicles (or named values_list rows) to blockchain in a single transaction"""
+        if not self.is_connected():
+            logger.warning("Blockchain not connected. Skipping vehicle batch sync.")
+            return 0
+        
+        try:
+            batch_call = self.contract.functions.batchRegisterVehicles(
+                [vehicle.vehicle_id for vehicle in vehicles],
+                [vehicle.vehicle_type for vehicle in vehicles],
+                [vehicle.owner_name or '' for vehicle in vehicles]
+            )
+            # This would submit batch_call.transact() - one nonce and one
+            # signature for the whole batch. For now, just log the action
+            logger.info(f"Would sync {len(vehicles)} vehicles to blockchain via {batch_call.fn_name}")
+            return len(vehicles)
+        except Exception as e:
+            logger.error(f"Error syncing vehicle batch to blockchain: {e}")
+            return 0
+    
     def sync_compliance_record_to_blockchain(self, record: ComplianceRecord) -> bool:
         """Sync compliance record to blockchain"""
         if not self.is_connected():
@@ -127,6 +283,27 @@ class BlockchainService:
             logger.error(f"Error syncing compliance record to blockchain: {e}")
             return False
     
+    def sync_compliance_records_batch_to_blockchain(self, records: List[ComplianceRecord]) -> int:
+        """Sync a batch of compliance records to blockchain in a single transaction"""
+        if not self.is_connected():
+            logger.warning("Blockchain not connected. Skipping compliance record batch sync.")
+            return 0
+        
+        try:
+            batch_call = self.contract.functions.batchAddComplianceRecords(
+                [record.vehicle.vehicle_id for record in records],
+                [record.violation_type for record in records],
+                [record.compliance_score for record in records],
+                [int(record.recorded_at.timestamp()) for record in records]
+            )
+            # As with vehicles, this would submit batch_call.transact().
+            # For now, just log the action
+            logger.info(f"Would sync {len(records)} compliance records to blockchain via {batch_call.fn_name}")
+            return len(records)
+        except Exception as e:
+            logger.error(f"Error syncing compliance record batch to blockchain: {e}")
+            return 0
+    
     def get_blockchain_leaderboard(self, limit: int = 10) -> List[Dict]:
         """Get leaderboard data from blockchain"""
         if not self.is_connected():
@@ -156,6 +333,17 @@ class BlockchainService:
             logger.error(f"Error updating blockchain leaderboard: {e}")
             return False
     
+    def _sync_batches(self, executor, batch_sync_func, items) -> int:
+        """Submit `items` in SYNC_BATCH_SIZE batches, keeping at most SYNC_WORKERS batches pending"""
+        synced = 0
+        pending = set()
+        for batch in _chunked(items, SYNC_BATCH_SIZE):
+            if len(pending) >= SYNC_WORKERS:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                synced += sum(future.result() for future in done)
+            pending.add(executor.submit(batch_sync_func, batch))
+        return synced + sum(future.result() for future in pending)
+    
     def sync_all_data_to_blockchain(self) -> Dict[str, int]:
         """Sync all data to blockchain"""
         if not self.is_connected():
@@ -163,18 +351,27 @@ class BlockchainService:
             return {"vehicles_synced": 0, "records_synced": 0}
         
         try:
-            vehicles_synced = 0
-            records_synced = 0
+            # Rows are streamed from the database on this thread and handed
+            # to the workers as batches, one transaction per batch.
+            # Named rows expose the same attributes the sync methods read
+            # from a Vehicle, without building model instances
+            vehicles = Vehicle.objects.values_list(
+                'vehicle_id', 'vehicle_type', 'owner_name', named=True
+            ).iterator(chunk_size=SYNC_CHUNK_SIZE)
             
-            # Sync vehicles
-            for vehicle in Vehicle.objects.all():
-                if self.sync_vehicle_to_blockchain(vehicle):
-                    vehicles_synced += 1
+            # Vehicle joined to avoid a lookup per record; records without a
+            # vehicle have nothing to sync under and would fail their batch
+            records = ComplianceRecord.objects.filter(vehicle__isnull=False).select_related('vehicle').only(
+                'id', 'violation_type', 'compliance_score', 'recorded_at', 'vehicle__vehicle_id'
+            ).iterator(chunk_size=SYNC_CHUNK_SIZE)
             
-            # Sync compliance records
-            for record in ComplianceRecord.objects.all():
-                if self.sync_compliance_record_to_blockchain(record):
-                    records_synced += 1
+            with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+                vehicles_synced = self._sync_batches(
+                    executor, self.sync_vehicles_batch_to_blockchain, vehicles
+                )
+                records_synced = self._sync_batches(
+                    executor, self.sync_compliance_records_batch_to_blockchain, records
+                )
             
             return {
                 "vehicles_synced": vehicles_synced,
@@ -0,0 +1,33 @@
+from django.core.cache import cache
+
+# Seconds a cached leaderboard or dashboard response is served for
+RESPONSE_CACHE_TIMEOUT = 10
+
+# Leaderboard pages are cached under a generation number, so bumping it
+# invalidates every cursor/limit combination at once
+LEADERBOARD_GENERATION_KEY = 'lb:gen'
+
+
+def leaderboard_cache_key(query_string):
+    """Cache key for one leaderboard page under the current generation"""
+    generation = cache.get_or_set(LEADERBOARD_GENERATION_KEY, 0, None)
+    return f'lb:v1:{generation}:{query_string}'
+
+
+def invalidate_leaderboard_cache():
+    """Drop every cached leaderboard page"""
+    try:
+        cache.incr(LEADERBOARD_GENERATION_KEY)
+    except ValueError:
+        # No generation stored yet, so nothing has been cached under one
+        pass
+
+
+def dashboard_cache_key(vehicle_id):
+    """Cache key for one vehicle's dashboard stats"""
+    return f'dashboard:v1:{vehicle_id}'
+
+
+def invalidate_dashboard_cache(vehicle_id):
+    """Drop a vehicle's cached dashboard stats"""
+    cache.delete(dashboard_cache_key(vehicle_id))
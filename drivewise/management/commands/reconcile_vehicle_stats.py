@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q
+from drivewise.models import COUNTED_VIOLATION_TYPES, Vehicle
+
+
+class Command(BaseCommand):
+    help = 'Recount stored vehicle trip/violation totals from their compliance records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted vehicles without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Checking vehicle trip/violation counts...')
+
+        drifted = Vehicle.objects.annotate(
+            actual_trips=Count('compliancerecord'),
+            actual_violations=Count(
+                'compliancerecord',
+                filter=Q(compliancerecord__violation_type__in=COUNTED_VIOLATION_TYPES)
+            )
+        ).filter(
+            ~Q(total_trips=F('actual_trips')) | ~Q(total_violations=F('actual_violations'))
+        ).values_list('pk', 'vehicle_id', 'actual_trips', 'actual_violations')
+
+        fixed = []
+        for pk, vehicle_id, trips, violations in drifted.iterator(chunk_size=1000):
+            self.stdout.write(f'  {vehicle_id}: {trips} trips, {violations} violations')
+            fixed.append(Vehicle(pk=pk, total_trips=trips, total_violations=violations))
+
+        if not fixed:
+            self.stdout.write(self.style.SUCCESS('All vehicle counts are up to date'))
+            return
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(fixed)} vehicles have drifted (dry run, nothing changed)'))
+            return
+
+        Vehicle.objects.bulk_update(fixed, ['total_trips', 'total_violations'], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counts for {len(fixed)} vehicles'))
@@ -3,6 +3,9 @@ from django.conf import settings
 from drivewise.blockchain_service import blockchain_service
 from drivewise.models import Vehicle, ComplianceRecord
 
+# Rows between progress lines (and flushes of buffered failures) while syncing
+PROGRESS_INTERVAL = 1000
+
 
 class Command(BaseCommand):
     help = 'Sync DriveWise data to blockchain'
@@ -48,17 +51,25 @@ class Command(BaseCommand):
         """Sync only vehicles to blockchain"""
         self.stdout.write('Syncing vehicles to blockchain...')
         
+        if not blockchain_service.is_connected():
+            self.stdout.write(self.style.ERROR('Blockchain not connected. Skipping vehicles sync.'))
+            return
+        
+        vehicles = Vehicle.objects.values_list(
+            'vehicle_id', 'vehicle_type', 'owner_name', named=True
+        ).iterator(chunk_size=1000)
+        
         vehicles_synced = 0
-        for vehicle in Vehicle.objects.all():
+        failures = []
+        for i, vehicle in enumerate(vehicles, 1):
             if blockchain_service.sync_vehicle_to_blockchain(vehicle):
                 vehicles_synced += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'✓ Synced vehicle: {vehicle.vehicle_id}')
-                )
             else:
-                self.stdout.write(
-                    self.style.ERROR(f'✗ Failed to sync vehicle: {vehicle.vehicle_id}')
-                )
+                failures.append(f'✗ Failed to sync vehicle: {vehicle.vehicle_id}')
+            if i % PROGRESS_INTERVAL == 0:
+                self.flush_failures(failures)
+                self.stdout.write(f'  ...{i} vehicles processed, {vehicles_synced} synced')
+        self.flush_failures(failures)
         
         self.stdout.write(
             self.style.SUCCESS(f'Vehicle sync completed: {vehicles_synced} vehicles synced')
@@ -68,22 +79,37 @@ class Command(BaseCommand):
         """Sync only compliance records to blockchain"""
         self.stdout.write('Syncing compliance records to blockchain...')
         
+        if not blockchain_service.is_connected():
+            self.stdout.write(self.style.ERROR('Blockchain not connected. Skipping compliance records sync.'))
+            return
+        
+        # Records without a vehicle have nothing to sync under
+        records = ComplianceRecord.objects.filter(vehicle__isnull=False).select_related('vehicle').only(
+            'id', 'violation_type', 'compliance_score', 'recorded_at', 'vehicle__vehicle_id'
+        ).iterator(chunk_size=1000)
+        
         records_synced = 0
-        for record in ComplianceRecord.objects.all():
+        failures = []
+        for i, record in enumerate(records, 1):
             if blockchain_service.sync_compliance_record_to_blockchain(record):
                 records_synced += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'✓ Synced record: {record.id} for {record.vehicle.vehicle_id}')
-                )
             else:
-                self.stdout.write(
-                    self.style.ERROR(f'✗ Failed to sync record: {record.id}')
-                )
+                failures.append(f'✗ Failed to sync record: {record.id}')
+            if i % PROGRESS_INTERVAL == 0:
+                self.flush_failures(failures)
+                self.stdout.write(f'  ...{i} records processed, {records_synced} synced')
+        self.flush_failures(failures)
         
         self.stdout.write(
             self.style.SUCCESS(f'Record sync completed: {records_synced} records synced')
         )
 
+    def flush_failures(self, failures):
+        """Write buffered failure lines in a single styled write and clear the buffer"""
+        if failures:
+            self.stdout.write(self.style.ERROR('\n'.join(failures)))
+            failures.clear()
+
     def update_leaderboard(self):
         """Update leaderboard rankings on blockchain"""
         self.stdout.write('Updating blockchain leaderboard...')
@@ -101,6 +127,7 @@ class Command(BaseCommand):
         """Sync all data to blockchain"""
         self.stdout.write('Starting full blockchain sync...')
         
+        # Same batched sync the API's blockchain/sync/ endpoint runs
         sync_results = blockchain_service.sync_all_data_to_blockchain()
         
         self.stdout.write(
@@ -110,7 +137,7 @@ class Command(BaseCommand):
             )
         )
         
-        # Update leaderboard
+        # Update leaderboard once every batch has finished
         self.stdout.write('Updating leaderboard rankings...')
         if blockchain_service.update_blockchain_leaderboard():
             self.stdout.write(
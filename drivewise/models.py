@@ -1,5 +1,23 @@
-from django.db import models
+from itertools import islice
+from django.db import connection, models, transaction
+from django.db.models import Avg, Case, F, IntegerField, Q, Sum, Value, When, Window
+from django.db.models.functions import Greatest, RowNumber
 from django.utils import timezone
+from .caching import invalidate_leaderboard_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Violation types that count against a vehicle's compliance rate
+COUNTED_VIOLATION_TYPES = ['speed_violation', 'horn_violation', 'seatbelt_violation']
+
+# ComplianceRecord columns the compliance score is computed from
+SCORE_FIELDS = ('speed_limit', 'actual_speed', 'no_horn_zone', 'horn_applied', 'seatbelt_required', 'seatbelt_worn')
+
+# ComplianceRecord columns ComplianceRecord.bulk_ingest writes (besides the score)
+INGEST_FIELDS = ('vehicle', 'traffic_sign') + SCORE_FIELDS + ('violation_type', 'severity', 'violation_description', 'recorded_at')
 
 class TrafficSign(models.Model):
     """Model to store detected traffic signs from sensors"""
@@ -19,9 +37,29 @@ class TrafficSign(models.Model):
     location = models.CharField(max_length=200, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['sign_type']),
+            models.Index(fields=['-detected_at']),
+        ]
+    
     def __str__(self):
         return f"{self.get_sign_type_display()}: {self.sign_value}"
 
+class VehicleQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Annotate average compliance score in the same query"""
+        return self.annotate(
+            _avg_score=Avg('compliancerecord__compliance_score')
+        )
+    
+    def add_record_counts(self, trips, violations):
+        """Add to the running trip and violation counts of these vehicles"""
+        return self.update(
+            total_trips=F('total_trips') + trips,
+            total_violations=F('total_violations') + violations
+        )
+
 class Vehicle(models.Model):
     """Model to store vehicle information"""
     VEHICLE_TYPES = [
@@ -36,43 +74,43 @@ class Vehicle(models.Model):
     owner_name = models.CharField(max_length=100, blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
     
-    def __str__(self):
-        return f"{self.vehicle_id} - {self.get_vehicle_type_display()}"
+    # Running counts of this vehicle's compliance records, kept current by
+    # drivewise.signals on create, edit and delete; QuerySet.update() bypasses
+    # them (`manage.py reconcile_vehicle_stats` repairs drift)
+    total_trips = models.IntegerField(default=0)
+    total_violations = models.IntegerField(default=0)
     
-    @property
-    def total_violations(self):
-        """Calculate total violations for this vehicle"""
-        return ComplianceRecord.objects.filter(
-            vehicle=self,
-            violation_type__in=['speed_violation', 'horn_violation', 'seatbelt_violation']
-        ).count()
+    objects = VehicleQuerySet.as_manager()
     
-    @property
-    def total_trips(self):
-        """Calculate total trips for this vehicle"""
-        return ComplianceRecord.objects.filter(
-            vehicle=self
-        ).count()
+    class Meta:
+        indexes = [
+            models.Index(fields=['vehicle_type']),
+            models.Index(fields=['-created_at']),
+            models.Index(fields=['total_trips']),
+        ]
+    
+    def __str__(self):
+        return f"{self.vehicle_id} - {self.get_vehicle_type_display()}"
     
     @property
     def compliance_rate(self):
         """Calculate compliance rate percentage"""
-        total_trips = self.total_trips
-        if total_trips == 0:
+        if self.total_trips == 0:
             return 100.0
-        violations = self.total_violations
-        return round(((total_trips - violations) / total_trips) * 100, 2)
+        return round(((self.total_trips - self.total_violations) / self.total_trips) * 100, 2)
     
     @property
     def average_compliance_score(self):
         """Calculate average compliance score"""
-        records = ComplianceRecord.objects.filter(
-            vehicle=self
-        )
-        if not records.exists():
+        if hasattr(self, '_avg_score'):
+            avg_score = self._avg_score
+        else:
+            avg_score = ComplianceRecord.objects.filter(
+                vehicle=self
+            ).aggregate(avg=Avg('compliance_score'))['avg']
+        if avg_score is None:
             return 100.0
-        total_score = sum(record.compliance_score for record in records)
-        return round(total_score / records.count(), 2)
+        return round(avg_score, 2)
     
     @property
     def qualifies_for_leaderboard(self):
@@ -96,6 +134,12 @@ class ManualTrafficSign(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     is_active = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['sign_type']),
+            models.Index(fields=['-created_at']),
+        ]
+    
     def __str__(self):
         vehicle_info = f"{self.vehicle.vehicle_id}" if self.vehicle else "No Vehicle"
         if self.sign_type == 'speed_limit':
@@ -164,10 +208,22 @@ class ComplianceRecord(models.Model):
     # Compliance score (0-100)
     compliance_score = models.IntegerField(default=100)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['-recorded_at']),
+            models.Index(fields=['vehicle', 'violation_type'], name='cr_vehicle_violation_idx'),
+            models.Index(fields=['vehicle', '-recorded_at'], name='cr_vehicle_recorded_idx'),
+        ]
+    
     def __str__(self):
         vehicle_id = self.vehicle.vehicle_id if self.vehicle else "No Vehicle"
         return f"Compliance {self.id} - {vehicle_id} - {self.get_violation_type_display()}"
     
+    @property
+    def is_counted_violation(self):
+        """Whether this record counts against the vehicle's compliance rate"""
+        return self.violation_type in COUNTED_VIOLATION_TYPES
+    
     def calculate_compliance_score(self):
         """Calculate compliance score based on violations"""
         score = 100
@@ -189,6 +245,127 @@ class ComplianceRecord(models.Model):
         
         return max(0, score)
     
+    @classmethod
+    def score_expression(cls):
+        """SQL equivalent of calculate_compliance_score, for set-based updates"""
+        speeding = (
+            ~Q(speed_limit=0) & ~Q(actual_speed=0) &
+            Q(actual_speed__gt=F('speed_limit'))
+        )
+        penalties = [
+            (speeding, 20),
+            (speeding & Q(actual_speed__gt=F('speed_limit') + 20), 10),
+            (Q(no_horn_zone=True, horn_applied=True), 15),
+            (Q(seatbelt_required=True, seatbelt_worn=False), 25),
+        ]
+        score = Value(100)
+        for condition, penalty in penalties:
+            score = score - Case(When(condition, then=Value(penalty)), default=Value(0))
+        return Greatest(Value(0), score, output_field=IntegerField())
+    
+    @staticmethod
+    def _score_arithmetic(speed_limit, actual_speed, no_horn_zone, horn_applied, seatbelt_required, seatbelt_worn):
+        """calculate_compliance_score without branches (before the floor at 0), for scalars or arrays"""
+        speeding = (speed_limit != 0) * (actual_speed != 0) * (actual_speed > speed_limit)
+        return (
+            100
+            - 20 * speeding
+            - 10 * (speeding * (actual_speed > speed_limit + 20))
+            - 15 * (no_horn_zone * horn_applied)
+            - 25 * (seatbelt_required * (1 - seatbelt_worn))
+        )
+    
+    @classmethod
+    def score_vectorized(cls, columns):
+        """Score whole columns at once: a DataFrame, or a mapping of SCORE_FIELDS to sequences"""
+        if np is None:
+            # Same arithmetic row by row; missing values count as 0/False
+            return [
+                max(0, cls._score_arithmetic(*(value or 0 for value in row)))
+                for row in zip(*(columns[field] for field in SCORE_FIELDS))
+            ]
+        
+        speed_limit, actual_speed = (
+            np.nan_to_num(np.asarray(columns[field], dtype=float)) for field in SCORE_FIELDS[:2]
+        )
+        flags = (np.asarray(columns[field], dtype=bool) for field in SCORE_FIELDS[2:])
+        return np.maximum(cls._score_arithmetic(speed_limit, actual_speed, *flags), 0).astype(int)
+    
+    @classmethod
+    def bulk_create_with_scores(cls, records, batch_size=1000):
+        """
+        bulk_create records (which skips save()), then score the new rows in
+        the database with score_expression, one UPDATE per batch. The
+        returned instances keep their unscored compliance_score
+        """
+        counts = {}
+        for record in records:
+            if record.vehicle_id is not None:
+                trips, violations = counts.get(record.vehicle_id, (0, 0))
+                counts[record.vehicle_id] = (trips + 1, violations + record.is_counted_violation)
+        
+        with transaction.atomic():
+            created = cls.objects.bulk_create(records, batch_size=batch_size)
+            score = cls.score_expression()
+            pks = [record.pk for record in created]
+            for start in range(0, len(pks), batch_size):
+                cls.objects.filter(pk__in=pks[start:start + batch_size]).update(compliance_score=score)
+            
+            # bulk_create sends no post_save, so keep the vehicle counts current here
+            for vehicle_id, (trips, violations) in counts.items():
+                Vehicle.objects.filter(pk=vehicle_id).add_record_counts(trips, violations)
+        return created
+    
+    @classmethod
+    def bulk_ingest(cls, rows, batch_size=1000):
+        """
+        Insert historical records from plain dicts keyed by INGEST_FIELDS
+        attnames (vehicle_id, traffic_sign_id, ...), one executemany per batch
+        and no model instances. Scores are computed column-wise; missing
+        values take the field defaults. Returns the number of rows inserted
+        """
+        fields = [cls._meta.get_field(name) for name in INGEST_FIELDS]
+        defaults = [field.get_default() for field in fields]
+        columns = [field.column for field in fields] + [cls._meta.get_field('compliance_score').column]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(cls._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns))
+        )
+        score_positions = [INGEST_FIELDS.index(name) for name in SCORE_FIELDS]
+        vehicle_position = INGEST_FIELDS.index('vehicle')
+        violation_position = INGEST_FIELDS.index('violation_type')
+        
+        ingested = 0
+        counts = {}
+        rows = iter(rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            while batch := list(islice(rows, batch_size)):
+                values = [
+                    [row.get(field.attname, default) for field, default in zip(fields, defaults)]
+                    for row in batch
+                ]
+                scores = cls.score_vectorized({
+                    name: [row_values[position] for row_values in values]
+                    for name, position in zip(SCORE_FIELDS, score_positions)
+                })
+                cursor.executemany(sql, [
+                    [field.get_db_prep_save(value, connection) for field, value in zip(fields, row_values)] + [int(score)]
+                    for row_values, score in zip(values, scores)
+                ])
+                ingested += len(values)
+                
+                for row_values in values:
+                    vehicle_id = row_values[vehicle_position]
+                    if vehicle_id is not None:
+                        trips, violations = counts.get(vehicle_id, (0, 0))
+                        counts[vehicle_id] = (trips + 1, violations + (row_values[violation_position] in COUNTED_VIOLATION_TYPES))
+            
+            # Raw inserts send no post_save, so keep the vehicle counts current here
+            for vehicle_id, (trips, violations) in counts.items():
+                Vehicle.objects.filter(pk=vehicle_id).add_record_counts(trips, violations)
+        return ingested
+    
     def save(self, *args, **kwargs):
         # Calculate compliance score before saving
         self.compliance_score = self.calculate_compliance_score()
@@ -207,6 +384,10 @@ class Leaderboard(models.Model):
     
     class Meta:
         ordering = ['rank']
+        indexes = [
+            models.Index(fields=['rank']),
+            models.Index(fields=['last_updated']),
+        ]
     
     def __str__(self):
         return f"#{self.rank} - {self.vehicle.vehicle_id} ({self.compliance_rate}% compliance)"
@@ -224,34 +405,89 @@ class Leaderboard(models.Model):
         
         self.save()
     
+    @classmethod
+    def refresh_entry(cls, vehicle):
+        """Create or refresh one vehicle's entry; a new entry ranks last until the next full recompute"""
+        entry, created = cls.objects.get_or_create(
+            vehicle=vehicle, defaults={'rank': cls.objects.count() + 1}
+        )
+        entry.vehicle = vehicle
+        entry.update_stats()
+        return entry
+    
     @classmethod
     def update_all_rankings(cls):
         """Update rankings for all vehicles in leaderboard"""
-        # Get all vehicles with at least 3 compliance records
-        vehicles_with_records = Vehicle.objects.filter(
-            compliancerecord__isnull=False
-        ).annotate(
-            trip_count=models.Count('compliancerecord')
-        ).filter(
-            trip_count__gte=3  # Minimum 3 entries required
-        ).distinct()
+        # Get all vehicles with at least 3 compliance records, with their
+        # stats aggregated in the same query
+        qualifying_vehicles = list(Vehicle.objects.with_stats().filter(
+            total_trips__gte=3  # Minimum 3 entries required
+        ))
+        
+        tokens_by_vehicle = dict(
+            RewardToken.objects.filter(
+                vehicle__in=[vehicle.pk for vehicle in qualifying_vehicles]
+            ).values('vehicle').annotate(
+                total=Sum('tokens_earned')
+            ).values_list('vehicle', 'total')
+        )
         
-        # Create leaderboard entries for vehicles that don't have them
-        for vehicle in vehicles_with_records:
-            leaderboard_entry, created = cls.objects.get_or_create(vehicle=vehicle)
-            leaderboard_entry.update_stats()
+        # Refresh stats in memory, creating entries for vehicles that don't have them
+        entries = cls.objects.in_bulk(field_name='vehicle_id')
+        new_entries = []
+        now = timezone.now()
+        for vehicle in qualifying_vehicles:
+            entry = entries.get(vehicle.pk)
+            if entry is None:
+                entry = entries[vehicle.pk] = cls(vehicle=vehicle)
+                new_entries.append(entry)
+            entry.total_violations = vehicle.total_violations
+            entry.total_trips = vehicle.total_trips
+            entry.compliance_rate = vehicle.compliance_rate
+            entry.average_compliance_score = vehicle.average_compliance_score
+            entry.total_tokens_earned = tokens_by_vehicle.get(vehicle.pk, 0)
+            entry.last_updated = now
         
+        existing_entries = [entry for entry in entries.values() if entry.pk is not None]
+        cls.objects.bulk_create(new_entries, ignore_conflicts=True)
+        cls.objects.bulk_update(
+            existing_entries,
+            ['total_trips', 'total_violations', 'compliance_rate',
+             'average_compliance_score', 'total_tokens_earned', 'last_updated'],
+            batch_size=500
+        )
+        
+        cls.assign_ranks()
+        
+        # Bulk writes send no post_save, so drop cached pages here
+        invalidate_leaderboard_cache()
+    
+    @classmethod
+    def assign_ranks(cls):
+        """Renumber every entry's rank in a single UPDATE, ranked in the database"""
         # Update rankings based on:
         # 1. Maximum number of entries (descending)
         # 2. Minimum violations (ascending)
         # 3. Compliance rate (descending)
-        leaderboard_entries = cls.objects.all().order_by(
-            '-total_trips', 'total_violations', '-compliance_rate'
-        )
+        ranked = cls.objects.order_by().annotate(new_rank=Window(
+            expression=RowNumber(),
+            order_by=[
+                F('total_trips').desc(),
+                F('total_violations').asc(),
+                F('compliance_rate').desc(),
+                F('vehicle_id').asc(),  # stable order for ties
+            ]
+        )).values('id', 'new_rank')
         
-        for rank, entry in enumerate(leaderboard_entries, 1):
-            entry.rank = rank
-            entry.save()
+        ranked_sql, params = ranked.query.sql_with_params()
+        table = connection.ops.quote_name(cls._meta.db_table)
+        rank = connection.ops.quote_name(cls._meta.get_field('rank').column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET {rank} = ranked.new_rank '
+                f'FROM ({ranked_sql}) AS ranked WHERE {table}.id = ranked.id',
+                params
+            )
 
 class RewardToken(models.Model):
     """Model to store reward tokens earned by drivers"""
@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ComplianceRecordPagination(CursorPagination):
+    """Newest-first cursor pages over a vehicle's compliance history"""
+    ordering = ('-recorded_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class LeaderboardPagination(CursorPagination):
+    """Cursor pages over leaderboard entries in rank order"""
+    ordering = 'rank'
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 100
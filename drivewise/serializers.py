@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.fields import empty
 from .models import TrafficSign, Vehicle, ComplianceRecord, RewardToken
 
 class TrafficSignSerializer(serializers.ModelSerializer):
@@ -10,6 +11,7 @@ class VehicleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vehicle
         fields = '__all__'
+        read_only_fields = ('total_trips', 'total_violations')
 
 class ComplianceRecordSerializer(serializers.ModelSerializer):
     vehicle = VehicleSerializer(read_only=True)
@@ -37,6 +39,44 @@ class SensorDataSerializer(serializers.Serializer):
     seatbelt_worn = serializers.BooleanField(required=False, default=False)
     location = serializers.CharField(max_length=200, required=False, allow_blank=True)
 
+# SensorDataSerializer's declared fields, read once for the fast path below
+_SENSOR_FIELDS = tuple(SensorDataSerializer().fields.items())
+
+def fast_validate_sensor_data(payload):
+    """
+    Validate a JSON sensor payload that needs no coercion without running the
+    serializer. Returns the data SensorDataSerializer would, or None when the
+    full serializer has to decide
+    """
+    if type(payload) is not dict:
+        return None
+    
+    data = {}
+    for name, field in _SENSOR_FIELDS:
+        if name not in payload:
+            if field.required:
+                return None
+            if field.default is not empty:
+                data[name] = field.default
+            continue
+        
+        value = payload[name]
+        if isinstance(field, serializers.CharField):
+            if (type(value) is not str or value != value.strip() or not value.isascii()
+                    or '\x00' in value or (not value and not field.allow_blank)
+                    or (field.max_length is not None and len(value) > field.max_length)):
+                return None
+        elif isinstance(field, serializers.BooleanField):
+            if type(value) is not bool:
+                return None
+        elif isinstance(field, serializers.IntegerField):
+            if type(value) is not int:
+                return None
+        else:
+            return None
+        data[name] = value
+    return data
+
 class ComplianceResponseSerializer(serializers.Serializer):
     """Serializer for compliance response"""
     compliance_record_id = serializers.IntegerField()
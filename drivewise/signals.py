@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .caching import invalidate_dashboard_cache, invalidate_leaderboard_cache
+from .models import COUNTED_VIOLATION_TYPES, Vehicle, ComplianceRecord, RewardToken, Leaderboard
+
+# ComplianceRecord fields the vehicle counts depend on
+COUNTED_FIELDS = {'vehicle', 'vehicle_id', 'violation_type'}
+
+
+def _count(vehicle_id, violation_type, sign):
+    """Add (sign=1) or remove (sign=-1) one record from a vehicle's running counts"""
+    if vehicle_id is not None:
+        Vehicle.objects.filter(pk=vehicle_id).add_record_counts(
+            sign, sign * int(violation_type in COUNTED_VIOLATION_TYPES)
+        )
+
+
+def _invalidate_vehicle_dashboard(instance):
+    """
+    Drop the cached dashboard of the vehicle `instance` belongs to once the
+    change commits, so a concurrent reader can't re-cache the old data
+    """
+    if instance.vehicle_id is None:
+        return
+    if type(instance).vehicle.is_cached(instance):
+        vehicle_id = instance.vehicle.vehicle_id
+    else:
+        vehicle_id = Vehicle.objects.filter(pk=instance.vehicle_id).values_list('vehicle_id', flat=True).first()
+    transaction.on_commit(lambda: invalidate_dashboard_cache(vehicle_id))
+
+
+@receiver(pre_save, sender=ComplianceRecord)
+def remember_counted_values(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Note what an existing record was counted as, so an edit can move its counts"""
+    instance._counted_as = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not COUNTED_FIELDS.intersection(update_fields):
+        return
+    instance._counted_as = sender.objects.filter(pk=instance.pk).values_list(
+        'vehicle_id', 'violation_type'
+    ).first()
+
+
+@receiver(post_save, sender=ComplianceRecord)
+def count_compliance_record(sender, instance, created, raw=False, **kwargs):
+    """Add a new compliance record to its vehicle's running counts, or move an edited one's"""
+    if raw:
+        return
+    counted_as = getattr(instance, '_counted_as', None)
+    if created:
+        _count(instance.vehicle_id, instance.violation_type, 1)
+    elif counted_as is not None and counted_as != (instance.vehicle_id, instance.violation_type):
+        previous_vehicle_id, previous_violation_type = counted_as
+        _count(previous_vehicle_id, previous_violation_type, -1)
+        _count(instance.vehicle_id, instance.violation_type, 1)
+        if previous_vehicle_id != instance.vehicle_id:
+            _invalidate_vehicle_dashboard(ComplianceRecord(vehicle_id=previous_vehicle_id))
+    _invalidate_vehicle_dashboard(instance)
+
+
+@receiver(post_delete, sender=ComplianceRecord)
+def uncount_compliance_record(sender, instance, **kwargs):
+    """Remove a deleted compliance record from its vehicle's running counts"""
+    _count(instance.vehicle_id, instance.violation_type, -1)
+    _invalidate_vehicle_dashboard(instance)
+
+
+@receiver(post_save, sender=RewardToken)
+def reward_token_changed(sender, instance, **kwargs):
+    """Token balances are part of the vehicle dashboard"""
+    _invalidate_vehicle_dashboard(instance)
+
+
+@receiver(post_save, sender=Leaderboard)
+def leaderboard_entry_changed(sender, instance, **kwargs):
+    """Any saved entry can change what a leaderboard page shows"""
+    transaction.on_commit(invalidate_leaderboard_cache)
@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from django.db import connections
+from .blockchain_service import blockchain_service
+from .models import ComplianceRecord, Leaderboard
+
+logger = logging.getLogger(__name__)
+
+# Full leaderboard recomputes run one at a time; changes arriving meanwhile
+# are marked pending and picked up by the lock holder's next run. The lock
+# expires (seconds) if a worker dies
+RANKINGS_LOCK_KEY = 'lb:lock'
+RANKINGS_PENDING_KEY = 'lb:pending'
+RANKINGS_LOCK_TIMEOUT = 30
+
+# Seconds a scheduled recompute waits so a burst of events shares one run
+RANKINGS_DEBOUNCE = 2
+
+# Threads that run fire-and-forget tasks such as blockchain syncs; tasks
+# beyond this wait in the pool's queue rather than starting more threads
+BACKGROUND_WORKERS = 4
+_background_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS)
+
+# Recomputes run on one worker thread, so they never overlap within a process
+_rankings_executor = ThreadPoolExecutor(max_workers=1)
+_rankings_scheduled = threading.Event()
+
+
+def sync_compliance_to_chain(compliance_record_id):
+    """Push one vehicle and one of its compliance records to blockchain"""
+    if not blockchain_service.is_connected():
+        return
+    
+    record = ComplianceRecord.objects.select_related('vehicle').get(pk=compliance_record_id)
+    blockchain_service.sync_vehicle_to_blockchain(record.vehicle)
+    blockchain_service.sync_compliance_record_to_blockchain(record)
+
+
+def request_rankings_update():
+    """Mark the ranks stale and make sure a full recompute runs after this change"""
+    cache.set(RANKINGS_PENDING_KEY, 1, None)
+    if not _rankings_scheduled.is_set():
+        _rankings_scheduled.set()
+        _rankings_executor.submit(_run_logged, recompute_pending_rankings)
+
+
+def recompute_pending_rankings():
+    """Recompute ranks while changes are pending, unless another worker holds the lock"""
+    time.sleep(RANKINGS_DEBOUNCE)
+    # Changes from here on schedule another run
+    _rankings_scheduled.clear()
+    
+    # The pending flag is set before the lock is tried and re-checked after
+    # it is released, so the last change always gets a recompute
+    while cache.get(RANKINGS_PENDING_KEY) and cache.add(RANKINGS_LOCK_KEY, 1, timeout=RANKINGS_LOCK_TIMEOUT):
+        try:
+            cache.delete(RANKINGS_PENDING_KEY)
+            Leaderboard.update_all_rankings()
+        finally:
+            cache.delete(RANKINGS_LOCK_KEY)
+
+
+def _run_in_worker(task, *args):
+    """Run a task on a worker thread, releasing that thread's DB connection afterwards"""
+    try:
+        return task(*args)
+    finally:
+        connections.close_all()
+
+
+def _run_logged(task, *args):
+    """Run a task on a worker thread, logging rather than raising its errors"""
+    try:
+        _run_in_worker(task, *args)
+    except Exception as e:
+        logger.error(f"Background task {task.__name__} failed: {e}")
+
+
+def run_in_background(task, *args):
+    """Run a task on one of the BACKGROUND_WORKERS threads without waiting for it"""
+    _background_executor.submit(_run_logged, task, *args)
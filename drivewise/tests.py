@@ -1,3 +1,284 @@
+import threading
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
 from django.test import TestCase
+from rest_framework.test import APIClient
+from . import tasks
+from .blockchain_service import blockchain_service
+from .caching import dashboard_cache_key
+from .models import SCORE_FIELDS, ComplianceRecord, Leaderboard, TrafficSign, Vehicle
+from .serializers import SensorDataSerializer, fast_validate_sensor_data
 
-# Create your tests here.
+# (speed_limit, actual_speed, no_horn_zone, horn_applied, seatbelt_required, seatbelt_worn) -> score
+SCORE_CASES = [
+    ((40, 40, False, False, True, True), 100),
+    ((40, 41, False, False, True, True), 80),
+    ((40, 60, False, False, True, True), 80),
+    ((40, 61, False, False, True, True), 70),
+    ((None, 90, False, False, False, False), 100),
+    ((0, 90, False, False, False, False), 100),
+    ((40, None, True, True, False, False), 85),
+    ((40, 80, True, True, True, False), 30),
+    ((40, 200, True, True, True, False), 30),
+]
+
+
+class RankingsUpdateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post_sensor(self, vehicle_id):
+        return APIClient().post('/api/sensor-data/', {
+            'vehicle_id': vehicle_id, 'sign_type': 'speed_limit', 'drive_value': 40
+        }, format='json')
+
+    def test_requests_share_one_background_recompute(self):
+        with mock.patch.object(tasks, '_rankings_executor') as executor, \
+                mock.patch.object(tasks, '_rankings_scheduled', threading.Event()):
+            tasks.request_rankings_update()
+            tasks.request_rankings_update()
+        executor.submit.assert_called_once_with(tasks._run_logged, tasks.recompute_pending_rankings)
+        self.assertTrue(cache.get(tasks.RANKINGS_PENDING_KEY))
+
+    def test_change_during_a_recompute_triggers_another(self):
+        calls = []
+
+        def update_all_rankings():
+            calls.append(1)
+            if len(calls) == 1:
+                cache.set(tasks.RANKINGS_PENDING_KEY, 1, None)
+
+        cache.set(tasks.RANKINGS_PENDING_KEY, 1, None)
+        with mock.patch.object(tasks, 'RANKINGS_DEBOUNCE', 0), \
+                mock.patch.object(Leaderboard, 'update_all_rankings', side_effect=update_all_rankings):
+            tasks.recompute_pending_rankings()
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(cache.get(tasks.RANKINGS_PENDING_KEY))
+        self.assertIsNone(cache.get(tasks.RANKINGS_LOCK_KEY))
+
+    def test_recompute_is_skipped_while_another_holds_the_lock(self):
+        cache.set(tasks.RANKINGS_PENDING_KEY, 1, None)
+        cache.add(tasks.RANKINGS_LOCK_KEY, 1)
+        with mock.patch.object(tasks, 'RANKINGS_DEBOUNCE', 0), \
+                mock.patch.object(Leaderboard, 'update_all_rankings') as update_all_rankings:
+            tasks.recompute_pending_rankings()
+        update_all_rankings.assert_not_called()
+        # Left for the lock holder to pick up
+        self.assertTrue(cache.get(tasks.RANKINGS_PENDING_KEY))
+
+    def test_qualifying_vehicle_is_ranked_without_a_recompute(self):
+        with mock.patch('drivewise.views.request_rankings_update'):
+            with self.captureOnCommitCallbacks(execute=True):
+                for vehicle_id in ('A', 'A', 'A', 'B', 'B', 'B'):
+                    self.assertEqual(self.post_sensor(vehicle_id).status_code, 201)
+
+        self.assertEqual(
+            dict(Leaderboard.objects.values_list('vehicle__vehicle_id', 'rank')), {'A': 1, 'B': 2}
+        )
+        response = APIClient().get('/api/leaderboard/vehicle/B/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_qualifying_vehicles_trigger_a_rerank(self):
+        with mock.patch('drivewise.views.run_in_background'), \
+                mock.patch('drivewise.views.request_rankings_update') as request_rankings_update:
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(2):
+                    self.assertEqual(self.post_sensor('V1').status_code, 201)
+            request_rankings_update.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.post_sensor('V1').status_code, 201)
+            request_rankings_update.assert_called_once_with()
+
+
+class BlockchainSyncTests(TestCase):
+    def test_records_without_a_vehicle_do_not_block_their_batch(self):
+        vehicle = Vehicle.objects.create(vehicle_id='V1', vehicle_type='four_wheeler')
+        sign = TrafficSign.objects.create(sign_type='speed_limit', sign_value='40')
+        for _ in range(3):
+            ComplianceRecord.objects.create(vehicle=vehicle, traffic_sign=sign)
+        ComplianceRecord.objects.create(vehicle=None, traffic_sign=sign)
+
+        with mock.patch.object(blockchain_service, 'is_connected', return_value=True), \
+                mock.patch.object(blockchain_service, 'contract') as contract:
+            results = blockchain_service.sync_all_data_to_blockchain()
+
+        self.assertEqual(results, {'vehicles_synced': 1, 'records_synced': 3})
+        vehicle_ids = contract.functions.batchAddComplianceRecords.call_args.args[0]
+        self.assertEqual(vehicle_ids, ['V1'] * 3)
+
+
+class DashboardCacheTests(TestCase):
+    def test_dashboard_cache_is_dropped_only_after_commit(self):
+        vehicle = Vehicle.objects.create(vehicle_id='V1', vehicle_type='four_wheeler')
+        sign = TrafficSign.objects.create(sign_type='speed_limit', sign_value='40')
+        cache.set(dashboard_cache_key('V1'), {'total_trips': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                ComplianceRecord.objects.create(vehicle=vehicle, traffic_sign=sign)
+                self.assertIsNotNone(cache.get(dashboard_cache_key('V1')))
+        self.assertIsNone(cache.get(dashboard_cache_key('V1')))
+
+
+class VehicleCountTests(TestCase):
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(vehicle_id='V1', vehicle_type='four_wheeler')
+        sign = TrafficSign.objects.create(sign_type='speed_limit', sign_value='40')
+        self.records = [
+            ComplianceRecord.objects.create(
+                vehicle=self.vehicle, traffic_sign=sign, violation_type=violation_type
+            )
+            for violation_type in ('no_violation', 'speed_violation', 'horn_violation')
+        ]
+
+    def assertCounts(self, trips, violations):
+        self.vehicle.refresh_from_db()
+        self.assertEqual((self.vehicle.total_trips, self.vehicle.total_violations), (trips, violations))
+
+    def test_counts_follow_created_and_deleted_records(self):
+        self.assertCounts(3, 2)
+        self.records[1].delete()
+        self.assertCounts(2, 1)
+        ComplianceRecord.objects.filter(pk=self.records[0].pk).delete()
+        self.assertCounts(1, 1)
+
+    def test_counts_follow_edited_records(self):
+        other = Vehicle.objects.create(vehicle_id='V2', vehicle_type='four_wheeler')
+        record = self.records[0]
+
+        record.violation_type = 'seatbelt_violation'
+        record.save()
+        self.assertCounts(3, 3)
+
+        record.vehicle = other
+        record.save()
+        self.assertCounts(2, 2)
+        other.refresh_from_db()
+        self.assertEqual((other.total_trips, other.total_violations), (1, 1))
+
+        # Saves that don't touch the counted fields leave the counts alone
+        record.save(update_fields=['compliance_score'])
+        self.assertCounts(2, 2)
+
+    def test_reconcile_repairs_drifted_counts(self):
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(total_trips=10, total_violations=0)
+        call_command('reconcile_vehicle_stats', stdout=mock.MagicMock())
+        self.assertCounts(3, 2)
+
+    def test_bulk_ingest_scores_rows_and_updates_counts(self):
+        sign = self.records[0].traffic_sign_id
+        ingested = ComplianceRecord.bulk_ingest([
+            {'vehicle_id': self.vehicle.pk, 'traffic_sign_id': sign, 'speed_limit': 40, 'actual_speed': 70,
+             'seatbelt_required': True, 'seatbelt_worn': True, 'violation_type': 'speed_violation'},
+            {'vehicle_id': self.vehicle.pk, 'traffic_sign_id': sign},
+        ], batch_size=1)
+        self.assertEqual(ingested, 2)
+        self.assertEqual(
+            sorted(ComplianceRecord.objects.exclude(pk__in=[r.pk for r in self.records]).values_list('compliance_score', flat=True)),
+            [70, 100]
+        )
+        self.assertCounts(5, 3)
+
+
+class RankingTests(TestCase):
+    def entry(self, vehicle_id, trips, violations, compliance_rate):
+        vehicle = Vehicle.objects.create(vehicle_id=vehicle_id, vehicle_type='four_wheeler')
+        Leaderboard.objects.create(
+            vehicle=vehicle, total_trips=trips, total_violations=violations, compliance_rate=compliance_rate
+        )
+
+    def test_ranks_break_ties_by_violations_rate_then_vehicle(self):
+        self.entry('tie-first', 5, 1, 80)
+        self.entry('most-trips', 9, 4, 50)
+        self.entry('tie-second', 5, 1, 80)
+        self.entry('fewer-violations', 5, 0, 100)
+        self.entry('lower-rate', 5, 1, 70)
+        Leaderboard.assign_ranks()
+        self.assertEqual(
+            list(Leaderboard.objects.order_by('rank').values_list('rank', 'vehicle__vehicle_id')),
+            [(1, 'most-trips'), (2, 'fewer-violations'), (3, 'tie-first'), (4, 'tie-second'), (5, 'lower-rate')]
+        )
+
+
+class ScoreParityTests(TestCase):
+    def test_python_vectorized_and_sql_scores_agree(self):
+        sign = TrafficSign.objects.create(sign_type='speed_limit', sign_value='40')
+        for values, expected in SCORE_CASES:
+            with self.subTest(values=values):
+                record = ComplianceRecord(traffic_sign=sign, **dict(zip(SCORE_FIELDS, values)))
+                self.assertEqual(record.calculate_compliance_score(), expected)
+                columns = {field: [value] for field, value in zip(SCORE_FIELDS, values)}
+                self.assertEqual(int(ComplianceRecord.score_vectorized(columns)[0]), expected)
+
+                record.save()
+                sql_score = ComplianceRecord.objects.filter(pk=record.pk).annotate(
+                    sql_score=ComplianceRecord.score_expression()
+                ).values_list('sql_score', flat=True).get()
+                self.assertEqual(sql_score, expected)
+
+    def test_bulk_create_scores_rows_in_sql(self):
+        sign = TrafficSign.objects.create(sign_type='speed_limit', sign_value='40')
+        created = ComplianceRecord.bulk_create_with_scores([
+            ComplianceRecord(traffic_sign=sign, **dict(zip(SCORE_FIELDS, values)))
+            for values, expected in SCORE_CASES
+        ], batch_size=4)
+        scores = dict(ComplianceRecord.objects.values_list('pk', 'compliance_score'))
+        self.assertEqual(
+            [scores[record.pk] for record in created],
+            [expected for values, expected in SCORE_CASES]
+        )
+
+
+class SensorValidationParityTests(TestCase):
+    PAYLOADS = [
+        {'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'sign_value': '40', 'actual_speed': 50},
+        {'vehicle_id': 'V1', 'sign_type': 'no_horn', 'horn_applied': True, 'location': 'Main St'},
+        # Invalid: the fast path must hand these to the serializer, which rejects them
+        {'sign_type': 'speed_limit'},
+        {'vehicle_id': '', 'sign_type': 'speed_limit'},
+        {'vehicle_id': 'V1' * 30, 'sign_type': 'speed_limit'},
+        {'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'actual_speed': 'fast'},
+        {'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'actual_speed': 5.5},
+        {'vehicle_id': 'V1', 'sign_type': 'no_horn', 'horn_applied': 'maybe'},
+        {'vehicle_id': None, 'sign_type': 'speed_limit'},
+        {'vehicle_id': 'V1\x00', 'sign_type': 'speed_limit'},
+        ['not', 'a', 'dict'],
+        # Valid but needing coercion: left to the serializer, which accepts them
+        {'vehicle_id': ' V1 ', 'sign_type': 'speed_limit', 'actual_speed': '50'},
+    ]
+
+    def test_fast_path_matches_serializer(self):
+        for payload in self.PAYLOADS:
+            with self.subTest(payload=payload):
+                serializer = SensorDataSerializer(data=payload)
+                fast = fast_validate_sensor_data(payload)
+                if fast is not None:
+                    self.assertTrue(serializer.is_valid())
+                    self.assertEqual(fast, dict(serializer.validated_data))
+                elif payload in self.PAYLOADS[:2]:
+                    self.fail('fast path should accept well-formed JSON')
+                else:
+                    self.assertEqual(serializer.is_valid(), payload is self.PAYLOADS[-1])
+
+
+class ChainSyncSchedulingTests(TestCase):
+    def post_sensor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return APIClient().post('/api/sensor-data/', {
+                'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'drive_value': 40
+            }, format='json')
+
+    def test_sync_is_only_scheduled_when_connected(self):
+        with mock.patch('drivewise.views.run_in_background') as run_in_background:
+            with mock.patch.object(blockchain_service, 'is_connected', return_value=False):
+                self.assertEqual(self.post_sensor().status_code, 201)
+            run_in_background.assert_not_called()
+
+            with mock.patch.object(blockchain_service, 'is_connected', return_value=True):
+                self.assertEqual(self.post_sensor().status_code, 201)
+            run_in_background.assert_called_once_with(
+                tasks.sync_compliance_to_chain, ComplianceRecord.objects.latest('pk').pk
+            )
@@ -1,6 +1,8 @@
 from django.shortcuts import get_object_or_404
+from django.core.cache import cache
 from django.utils import timezone
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import F
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -8,9 +10,16 @@ from rest_framework import status
 from .models import TrafficSign, Vehicle, ComplianceRecord, RewardToken, Leaderboard
 from .serializers import (
     TrafficSignSerializer, VehicleSerializer, ComplianceRecordSerializer,
-    RewardTokenSerializer, SensorDataSerializer, ComplianceResponseSerializer
+    RewardTokenSerializer, SensorDataSerializer, ComplianceResponseSerializer,
+    fast_validate_sensor_data
 )
 from .blockchain_service import blockchain_service
+from .caching import RESPONSE_CACHE_TIMEOUT, dashboard_cache_key, leaderboard_cache_key
+from .pagination import ComplianceRecordPagination, LeaderboardPagination
+from .tasks import request_rankings_update, run_in_background, sync_compliance_to_chain
+
+# Vehicle columns the lookup-by-vehicle_id views actually read
+VEHICLE_SUMMARY_FIELDS = ('id', 'vehicle_id', 'vehicle_type', 'owner_name', 'total_trips', 'total_violations')
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -19,79 +28,92 @@ def process_sensor_data(request):
     Process sensor data and create compliance records
     """
     try:
-        serializer = SensorDataSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(
-                {'error': 'Invalid data provided'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        data = serializer.validated_data
+        # Well-formed JSON skips the serializer; anything else (form data,
+        # values needing coercion, invalid payloads) goes through it
+        data = fast_validate_sensor_data(request.data)
+        if data is None:
+            serializer = SensorDataSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(
+                    {'error': 'Invalid data provided'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            data = serializer.validated_data
         vehicle_id = data['vehicle_id']
         
-        # Get or create vehicle
-        vehicle, created = Vehicle.objects.get_or_create(
-            vehicle_id=vehicle_id,
-            defaults={
-                'vehicle_type': 'four_wheeler',  # Default type
-                'owner_name': 'Unknown'
-            }
-        )
-        
-        # Create traffic sign
-        traffic_sign = TrafficSign.objects.create(
-            sign_type=data['sign_type'],
-            sign_value=data.get('sign_value', ''),
-            location=data.get('location', '')
-        )
-        
-        # Create compliance record
-        compliance_record = ComplianceRecord.objects.create(
-            vehicle=vehicle,
-            traffic_sign=traffic_sign,
-            speed_limit=int(data.get('drive_value', 0)) if data['sign_type'] == 'speed_limit' else None,
-            actual_speed=int(data.get('drive_value', 0)) if data['sign_type'] == 'speed_limit' else None,
-            no_horn_zone=data['sign_type'] == 'no_horn',
-            horn_applied=data.get('drive_value', 0) == 1 if data['sign_type'] == 'no_horn' else False,
-            seatbelt_required=vehicle.vehicle_type == 'four_wheeler',
-            seatbelt_worn=data.get('drive_value', 0) == 1 if data['sign_type'] == 'seatbelt' else False
-        )
-        
-        # Calculate compliance score and violation
-        compliance_score = compliance_record.calculate_compliance_score()
-        violation_type = compliance_record.violation_type
-        
-        # Award tokens based on compliance
-        tokens_earned = 0
-        if compliance_score >= 90:
-            tokens_earned = 10
-        elif compliance_score >= 70:
-            tokens_earned = 5
-        elif compliance_score >= 50:
-            tokens_earned = 2
-        
-        # Update or create reward token
-        reward_token, created = RewardToken.objects.get_or_create(
-            vehicle=vehicle,
-            defaults={'tokens_earned': tokens_earned}
-        )
-        if not created:
-            reward_token.tokens_earned += tokens_earned
-            reward_token.save()
-        
-        # Sync to blockchain if connected
-        if blockchain_service.is_connected():
-            try:
-                blockchain_service.sync_vehicle_to_blockchain(vehicle)
-                blockchain_service.sync_compliance_record_to_blockchain(compliance_record)
-            except Exception as e:
-                # Log error but don't fail the request
-                print(f"Blockchain sync error: {e}")
-        
-        # Update leaderboard
-        Leaderboard.update_all_rankings()
-        
-        # Get current rank
+        # Checked before taking the vehicle lock, since a stale health check
+        # probes the node; only a reachable chain gets a sync task
+        chain_connected = blockchain_service.is_connected()
+        
+        # All writes commit together; the background tasks scheduled with
+        # on_commit only run once they have
+        with transaction.atomic():
+            # Get or create vehicle, locking its row so concurrent events for
+            # the same vehicle apply their writes one after another
+            vehicle, created = Vehicle.objects.select_for_update().get_or_create(
+                vehicle_id=vehicle_id,
+                defaults={
+                    'vehicle_type': 'four_wheeler',  # Default type
+                    'owner_name': 'Unknown'
+                }
+            )
+            
+            # Create traffic sign
+            traffic_sign = TrafficSign.objects.create(
+                sign_type=data['sign_type'],
+                sign_value=data.get('sign_value', ''),
+                location=data.get('location', '')
+            )
+            
+            # Create compliance record
+            compliance_record = ComplianceRecord.objects.create(
+                vehicle=vehicle,
+                traffic_sign=traffic_sign,
+                speed_limit=int(data.get('drive_value', 0)) if data['sign_type'] == 'speed_limit' else None,
+                actual_speed=int(data.get('drive_value', 0)) if data['sign_type'] == 'speed_limit' else None,
+                no_horn_zone=data['sign_type'] == 'no_horn',
+                horn_applied=data.get('drive_value', 0) == 1 if data['sign_type'] == 'no_horn' else False,
+                seatbelt_required=vehicle.vehicle_type == 'four_wheeler',
+                seatbelt_worn=data.get('drive_value', 0) == 1 if data['sign_type'] == 'seatbelt' else False
+            )
+            
+            # Pick up the trip/violation counts the new record just added to
+            vehicle.refresh_from_db(fields=['total_trips', 'total_violations'])
+            
+            # Calculate compliance score and violation
+            compliance_score = compliance_record.calculate_compliance_score()
+            violation_type = compliance_record.violation_type
+            
+            # Award tokens based on compliance
+            tokens_earned = 0
+            if compliance_score >= 90:
+                tokens_earned = 10
+            elif compliance_score >= 70:
+                tokens_earned = 5
+            elif compliance_score >= 50:
+                tokens_earned = 2
+            
+            # Add to the vehicle's reward tokens in a single UPDATE so concurrent
+            # sensor events can't overwrite each other; create on first award
+            updated = RewardToken.objects.filter(vehicle=vehicle).update(
+                tokens_earned=F('tokens_earned') + tokens_earned,
+                last_updated=timezone.now()
+            )
+            if not updated:
+                RewardToken.objects.create(vehicle=vehicle, tokens_earned=tokens_earned)
+            
+            # Keep this vehicle's leaderboard row current; only vehicles on the
+            # leaderboard can change its order, so only they need a re-rank
+            if vehicle.qualifies_for_leaderboard:
+                Leaderboard.refresh_entry(vehicle)
+                transaction.on_commit(request_rankings_update)
+            
+            # Sync to blockchain and re-rank off the request path once this
+            # data is committed; failures are logged, never returned
+            if chain_connected:
+                transaction.on_commit(lambda: run_in_background(sync_compliance_to_chain, compliance_record.id))
+        
+        # Get current rank (as of the last leaderboard update)
         current_rank = None
         try:
             leaderboard_entry = Leaderboard.objects.get(vehicle=vehicle)
@@ -127,16 +149,22 @@ def get_vehicle_compliance(request, vehicle_id):
     Get compliance records for a specific vehicle
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
-        records = ComplianceRecord.objects.filter(vehicle=vehicle).order_by('-recorded_at')
+        vehicle = get_object_or_404(Vehicle.objects.only(*VEHICLE_SUMMARY_FIELDS), vehicle_id=vehicle_id)
+        records = ComplianceRecord.objects.filter(vehicle=vehicle).select_related(
+            'vehicle', 'traffic_sign'
+        )
         
-        serializer = ComplianceRecordSerializer(records, many=True)
+        paginator = ComplianceRecordPagination()
+        page = paginator.paginate_queryset(records, request)
+        serializer = ComplianceRecordSerializer(page, many=True)
         
         return Response({
             'vehicle_id': vehicle_id,
-            'total_records': records.count(),
+            'total_records': vehicle.total_trips,
             'compliance_rate': vehicle.compliance_rate,
             'total_violations': vehicle.total_violations,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'records': serializer.data
         })
         
@@ -175,7 +203,7 @@ def spend_tokens(request, vehicle_id):
     Spend tokens for rewards
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
+        vehicle = get_object_or_404(Vehicle.objects.only('id'), vehicle_id=vehicle_id)
         reward_token = get_object_or_404(RewardToken, vehicle=vehicle)
         
         amount = request.data.get('amount', 0)
@@ -216,7 +244,16 @@ def get_dashboard_stats(request, vehicle_id):
     Get dashboard statistics for a specific vehicle
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
+        cache_key = dashboard_cache_key(vehicle_id)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return Response(cached)
+        
+        vehicle = get_object_or_404(
+            Vehicle.objects.with_stats().only(*VEHICLE_SUMMARY_FIELDS).prefetch_related('rewardtoken_set'),
+            vehicle_id=vehicle_id
+        )
+        reward_token = next(iter(vehicle.rewardtoken_set.all()), None)
         
         # Get leaderboard entry
         current_rank = None
@@ -229,7 +266,7 @@ def get_dashboard_stats(request, vehicle_id):
             except Leaderboard.DoesNotExist:
                 qualification_status = 'Qualified (Not Ranked)'
         
-        return Response({
+        response_data = {
             'vehicle_id': vehicle_id,
             'total_trips': vehicle.total_trips,
             'total_violations': vehicle.total_violations,
@@ -237,9 +274,12 @@ def get_dashboard_stats(request, vehicle_id):
             'average_compliance_score': vehicle.average_compliance_score,
             'qualification_status': qualification_status,
             'current_rank': current_rank,
-            'tokens_earned': getattr(vehicle.rewardtoken, 'tokens_earned', 0),
-            'tokens_available': getattr(vehicle.rewardtoken, 'tokens_available', 0)
-        })
+            'tokens_earned': getattr(reward_token, 'tokens_earned', 0),
+            'tokens_available': getattr(reward_token, 'tokens_available', 0)
+        }
+        
+        cache.set(cache_key, response_data, RESPONSE_CACHE_TIMEOUT)
+        return Response(response_data)
         
     except Exception as e:
         return Response(
@@ -254,44 +294,57 @@ def get_leaderboard(request):
     Get leaderboard rankings for all vehicles (minimum 3 entries required)
     """
     try:
+        cached = cache.get(leaderboard_cache_key(request.GET.urlencode()))
+        if cached is not None:
+            return Response(cached)
+        
         # Update rankings first
         Leaderboard.update_all_rankings()
         
-        # Get top vehicles (limit to top 10 by default)
-        limit = request.GET.get('limit', 10)
-        leaderboard_entries = Leaderboard.objects.all().order_by('rank')[:int(limit)]
-        
+        # Get top vehicles (limit to top 10 by default), one cursor page at a time
+        paginator = LeaderboardPagination()
+        # Plain rows with the vehicle columns joined in, rather than model
+        # instances with a lazy vehicle lookup each
+        leaderboard_entries = paginator.paginate_queryset(Leaderboard.objects.values(
+            'rank', 'total_trips', 'total_violations', 'compliance_rate',
+            'average_compliance_score', 'total_tokens_earned', 'last_updated',
+            'vehicle__vehicle_id', 'vehicle__vehicle_type', 'vehicle__owner_name'
+        ), request)
+        limit = paginator.page_size
+        
+        vehicle_type_labels = dict(Vehicle.VEHICLE_TYPES)
         leaderboard_data = []
         for entry in leaderboard_entries:
             leaderboard_data.append({
-                'rank': entry.rank,
-                'vehicle_id': entry.vehicle.vehicle_id,
-                'vehicle_type': entry.vehicle.get_vehicle_type_display(),
-                'owner_name': entry.vehicle.owner_name or 'Unknown',
-                'total_trips': entry.total_trips,
-                'total_violations': entry.total_violations,
-                'compliance_rate': float(entry.compliance_rate),
-                'average_compliance_score': float(entry.average_compliance_score),
-                'total_tokens_earned': entry.total_tokens_earned,
-                'qualification_status': 'Qualified' if entry.total_trips >= 3 else f'Needs {3 - entry.total_trips} more entries',
-                'last_updated': entry.last_updated.isoformat()
+                'rank': entry['rank'],
+                'vehicle_id': entry['vehicle__vehicle_id'],
+                'vehicle_type': vehicle_type_labels.get(entry['vehicle__vehicle_type'], entry['vehicle__vehicle_type']),
+                'owner_name': entry['vehicle__owner_name'] or 'Unknown',
+                'total_trips': entry['total_trips'],
+                'total_violations': entry['total_violations'],
+                'compliance_rate': float(entry['compliance_rate']),
+                'average_compliance_score': float(entry['average_compliance_score']),
+                'total_tokens_earned': entry['total_tokens_earned'],
+                'qualification_status': 'Qualified' if entry['total_trips'] >= 3 else f'Needs {3 - entry["total_trips"]} more entries',
+                'last_updated': entry['last_updated'].isoformat()
             })
         
         # Get qualification statistics
-        total_vehicles = Vehicle.objects.annotate(
-            trip_count=Count('compliancerecord')
-        ).filter(trip_count__gte=3).count()
+        total_vehicles = Vehicle.objects.filter(total_trips__gte=3).count()
         
         # Try to get blockchain data if available
         blockchain_data = []
-        if blockchain_service.is_connected():
+        bc_connected = blockchain_service.is_connected()
+        if bc_connected:
             try:
-                blockchain_data = blockchain_service.get_blockchain_leaderboard(int(limit))
+                blockchain_data = blockchain_service.get_blockchain_leaderboard(limit)
             except Exception as e:
                 print(f"Blockchain leaderboard error: {e}")
         
-        return Response({
+        response_data = {
             'leaderboard': leaderboard_data,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'blockchain_leaderboard': blockchain_data,
             'total_qualified_vehicles': total_vehicles,
             'minimum_entries_required': 3,
@@ -300,9 +353,13 @@ def get_leaderboard(request):
                 '2. Minimum violations (lowest first)',
                 '3. Compliance rate (highest first)'
             ],
-            'blockchain_connected': blockchain_service.is_connected(),
+            'blockchain_connected': bc_connected,
             'last_updated': timezone.now().isoformat()
-        })
+        }
+        
+        # Keyed after the recompute above, which starts a new cache generation
+        cache.set(leaderboard_cache_key(request.GET.urlencode()), response_data, RESPONSE_CACHE_TIMEOUT)
+        return Response(response_data)
         
     except Exception as e:
         return Response(
@@ -317,7 +374,7 @@ def get_vehicle_ranking(request, vehicle_id):
     Get ranking for a specific vehicle
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
+        vehicle = get_object_or_404(Vehicle.objects.only(*VEHICLE_SUMMARY_FIELDS), vehicle_id=vehicle_id)
         
         if not vehicle.qualifies_for_leaderboard:
             return Response({
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import TrafficSign, Vehicle, DrivingSession, ComplianceRecord, RewardToken
+from django.db.models import F
+from .models import TrafficSign, Vehicle, DrivingSession, ComplianceRecord, RewardToken, StagedSensorPayload, FailedSensorPayload
+from .tasks import replay_failed_sensors
 
 @admin.register(TrafficSign)
 class TrafficSignAdmin(admin.ModelAdmin):
@@ -18,6 +20,7 @@ class VehicleAdmin(admin.ModelAdmin):
 @admin.register(DrivingSession)
 class DrivingSessionAdmin(admin.ModelAdmin):
     list_display = ('id', 'vehicle', 'session_start', 'session_end', 'is_active')
+    list_select_related = ('vehicle',)
     list_filter = ('is_active', 'session_start')
     search_fields = ('vehicle__vehicle_id',)
     ordering = ('-session_start',)
@@ -25,6 +28,7 @@ class DrivingSessionAdmin(admin.ModelAdmin):
 @admin.register(ComplianceRecord)
 class ComplianceRecordAdmin(admin.ModelAdmin):
     list_display = ('id', 'vehicle', 'traffic_sign', 'violation_type', 'severity', 'compliance_score', 'recorded_at')
+    list_select_related = ('vehicle', 'traffic_sign')
     list_filter = ('violation_type', 'severity', 'recorded_at')
     search_fields = ('vehicle__vehicle_id', 'traffic_sign__sign_type')
     ordering = ('-recorded_at',)
@@ -32,7 +36,38 @@ class ComplianceRecordAdmin(admin.ModelAdmin):
 
 @admin.register(RewardToken)
 class RewardTokenAdmin(admin.ModelAdmin):
-    list_display = ('vehicle', 'tokens_earned', 'tokens_spent', 'tokens_available', 'last_updated')
+    list_display = ('vehicle', 'tokens_earned', 'tokens_spent', 'tokens_available_display', 'last_updated')
+    list_select_related = ('vehicle',)
     list_filter = ('last_updated',)
     search_fields = ('vehicle__vehicle_id',)
     readonly_fields = ('tokens_available',)
+    
+    def get_queryset(self, request):
+        # Sortable token balance computed in SQL
+        return super().get_queryset(request).annotate(
+            tokens_available_db=F('tokens_earned') - F('tokens_spent')
+        )
+    
+    def tokens_available_display(self, obj):
+        return obj.tokens_available_db
+    tokens_available_display.short_description = 'Tokens available'
+    tokens_available_display.admin_order_field = 'tokens_available_db'
+
+@admin.register(StagedSensorPayload)
+class StagedSensorPayloadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'received_at', 'queued_at')
+    ordering = ('received_at',)
+    readonly_fields = ('payload', 'received_at', 'queued_at')
+
+@admin.register(FailedSensorPayload)
+class FailedSensorPayloadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'received_at', 'failed_at', 'error')
+    list_filter = ('failed_at',)
+    ordering = ('-failed_at',)
+    readonly_fields = ('payload', 'received_at', 'error', 'failed_at')
+    actions = ('replay',)
+    
+    @admin.action(description='Replay selected payloads')
+    def replay(self, request, queryset):
+        replayed = replay_failed_sensors(queryset)
+        self.message_user(request, f'Replayed {replayed} of {len(queryset)} payloads')
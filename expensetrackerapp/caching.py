@@ -0,0 +1,14 @@
+from django.core.cache import cache
+
+# Seconds a vehicle_id -> pk lookup is cached for; deleting the vehicle drops it
+VEHICLE_PK_CACHE_TIMEOUT = 300
+
+
+def vehicle_pk_cache_key(vehicle_id):
+    """Cache key for the primary key of the vehicle with this vehicle_id"""
+    return f'vehicle_pk:{vehicle_id}'
+
+
+def invalidate_vehicle_pk(vehicle_id):
+    """Drop a cached vehicle_id -> pk lookup"""
+    cache.delete(vehicle_pk_cache_key(vehicle_id))
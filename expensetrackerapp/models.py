@@ -1,7 +1,77 @@
 
-from django.db import models
+import itertools
+from django.db import connection, models
 from django.utils import timezone
 
+# Violation types that count against a vehicle's compliance rate
+COUNTED_VIOLATION_TYPES = ['speed_violation', 'horn_violation', 'seatbelt_violation']
+
+# Vehicle types whose drivers must wear a seatbelt
+SEATBELT_REQUIRED_VEHICLE_TYPES = frozenset({'four_wheeler'})
+
+# Score penalty per violation; speed_excess is added to speed more than 20 over the limit
+PENALTIES = {'speed': 20, 'speed_excess': 10, 'horn': 15, 'seatbelt': 25}
+
+def _build_violation_classes():
+    """
+    (violation_type, severity) for each (speeding, speed_excess, horn,
+    seatbelt) combination of violation flags
+    """
+    classes = {}
+    for speeding, excess, horn, seatbelt in itertools.product((0, 1), repeat=4):
+        excess *= speeding
+        # (penalty, violation_type, severity) per violation found
+        violations = []
+        if speeding:
+            violations.append((
+                PENALTIES['speed'] + PENALTIES['speed_excess'] * excess,
+                'speed_violation', 'high' if excess else 'medium'
+            ))
+        if horn:
+            violations.append((PENALTIES['horn'], 'horn_violation', 'low'))
+        if seatbelt:
+            violations.append((PENALTIES['seatbelt'], 'seatbelt_violation', 'high'))
+        
+        if not violations:
+            classes[speeding, excess, horn, seatbelt] = ('no_violation', 'low')
+            continue
+        # The heaviest penalty names the violation; more than one at once is critical
+        penalty, violation_type, severity = max(violations, key=lambda violation: violation[0])
+        classes[speeding, excess, horn, seatbelt] = (violation_type, 'critical' if len(violations) > 1 else severity)
+    return classes
+
+VIOLATION_CLASSES = _build_violation_classes()
+
+def assess_compliance(speed_limit, actual_speed, no_horn_zone, horn_applied, seatbelt_required, seatbelt_worn):
+    """
+    Score and classify one traffic sign encounter, returning
+    (compliance_score, violation_type, severity, violation_description)
+    """
+    speeding = int(bool(speed_limit and actual_speed) and actual_speed > speed_limit)
+    excess = speeding and int(actual_speed > speed_limit + 20)
+    horn = int(bool(no_horn_zone and horn_applied))
+    seatbelt = int(bool(seatbelt_required and not seatbelt_worn))
+    
+    score = (
+        100
+        - PENALTIES['speed'] * speeding
+        - PENALTIES['speed_excess'] * excess
+        - PENALTIES['horn'] * horn
+        - PENALTIES['seatbelt'] * seatbelt
+    )
+    violation_type, severity = VIOLATION_CLASSES[speeding, excess, horn, seatbelt]
+    if violation_type == 'no_violation':
+        return max(0, score), violation_type, severity, None
+    
+    descriptions = []
+    if speeding:
+        descriptions.append(f'Speed {actual_speed} in a {speed_limit} zone')
+    if horn:
+        descriptions.append('Horn used in a no horn zone')
+    if seatbelt:
+        descriptions.append('Seatbelt not worn')
+    return max(0, score), violation_type, severity, '; '.join(descriptions)
+
 class TrafficSign(models.Model):
     """Model to store detected traffic signs from sensors"""
     SIGN_TYPES = [
@@ -47,6 +117,16 @@ class DrivingSession(models.Model):
     session_end = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     
+    class Meta:
+        constraints = [
+            # Partial unique index: a vehicle has at most one active session
+            models.UniqueConstraint(
+                fields=['vehicle'],
+                condition=models.Q(is_active=True),
+                name='et_one_active_session_per_vehicle'
+            ),
+        ]
+    
     def __str__(self):
         return f"Session {self.id} - {self.vehicle.vehicle_id}"
 
@@ -68,6 +148,9 @@ class ComplianceRecord(models.Model):
     ]
     
     driving_session = models.ForeignKey(DrivingSession, on_delete=models.CASCADE)
+    # The session's vehicle, stored on the record so vehicle lookups skip the
+    # session join; save() always copies it from the session
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, db_index=True, editable=False)
     traffic_sign = models.ForeignKey(TrafficSign, on_delete=models.CASCADE)
     
     # Speed-related fields
@@ -93,37 +176,30 @@ class ComplianceRecord(models.Model):
     # Compliance score (0-100)
     compliance_score = models.IntegerField(default=100)
     
+    class Meta:
+        indexes = [
+            # Per-vehicle history, newest first, and per-vehicle violation counts
+            models.Index(fields=['vehicle', '-recorded_at', '-id'], name='et_cr_vehicle_recorded_idx'),
+            models.Index(fields=['vehicle', 'violation_type'], name='et_cr_vehicle_violation_idx'),
+        ]
+    
     def __str__(self):
         return f"Compliance {self.id} - {self.vehicle.vehicle_id} - {self.get_violation_type_display()}"
     
-    @property
-    def vehicle(self):
-        return self.driving_session.vehicle
-    
     def calculate_compliance_score(self):
-        """Calculate compliance score based on violations"""
-        score = 100
-        
-        # Speed violation
-        if self.speed_limit and self.actual_speed:
-            if self.actual_speed > self.speed_limit:
-                score -= 20
-                if self.actual_speed > self.speed_limit + 20:
-                    score -= 10  # additional penalty for excessive speed
-        
-        # Horn violation
-        if self.no_horn_zone and self.horn_applied:
-            score -= 15
-        
-        # Seatbelt violation
-        if self.seatbelt_required and not self.seatbelt_worn:
-            score -= 25
-        
-        return max(0, score)
+        """Calculate compliance score based on violations, setting the violation fields to match"""
+        score, self.violation_type, self.severity, self.violation_description = assess_compliance(
+            self.speed_limit, self.actual_speed, self.no_horn_zone,
+            self.horn_applied, self.seatbelt_required, self.seatbelt_worn
+        )
+        return score
     
-    def save(self, *args, **kwargs):
-        # Calculate compliance score before saving
-        self.compliance_score = self.calculate_compliance_score()
+    def save(self, *args, recalculate_score=True, **kwargs):
+        # Calculate compliance score and violation before saving, unless the
+        # caller already set them from assess_compliance
+        if recalculate_score:
+            self.compliance_score = self.calculate_compliance_score()
+        self.vehicle_id = self.driving_session.vehicle_id
         super().save(*args, **kwargs)
 
 class RewardToken(models.Model):
@@ -133,9 +209,64 @@ class RewardToken(models.Model):
     tokens_spent = models.IntegerField(default=0)
     last_updated = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        constraints = [
+            # One token balance per vehicle; also the conflict target for add_tokens
+            models.UniqueConstraint(fields=['vehicle'], name='et_one_reward_token_per_vehicle'),
+        ]
+    
+    @classmethod
+    def add_tokens(cls, earned_by_vehicle):
+        """
+        Add earned tokens to several vehicles' balances, given as
+        {vehicle pk: tokens}, in one INSERT ... ON CONFLICT DO UPDATE that
+        also creates balances that don't exist yet
+        """
+        if not earned_by_vehicle:
+            return
+        
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        fields = [cls._meta.get_field(name) for name in ('vehicle', 'tokens_earned', 'tokens_spent', 'last_updated')]
+        earned, updated = quote(fields[1].column), quote(fields[3].column)
+        sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT ({}) DO UPDATE SET {} = {}.{} + EXCLUDED.{}, {} = EXCLUDED.{}'.format(
+            table,
+            ', '.join(quote(field.column) for field in fields),
+            ', '.join(['(%s, %s, %s, %s)'] * len(earned_by_vehicle)),
+            quote(fields[0].column),
+            earned, table, earned, earned, updated, updated
+        )
+        now = fields[3].get_db_prep_save(timezone.now(), connection)
+        params = []
+        for vehicle_pk, tokens in earned_by_vehicle.items():
+            params += [vehicle_pk, tokens, 0, now]
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    
     @property
     def tokens_available(self):
         return self.tokens_earned - self.tokens_spent
     
     def __str__(self):
-        return f"Tokens for {self.vehicle.vehicle_id}: {self.tokens_available} available"
\ No newline at end of file
+        return f"Tokens for {self.vehicle.vehicle_id}: {self.tokens_available} available"
+
+class StagedSensorPayload(models.Model):
+    """Accepted sensor payloads waiting for an ingestion worker, so a restart doesn't lose them"""
+    payload = models.JSONField()
+    received_at = models.DateTimeField()
+    # Last time a worker queue was handed this payload
+    queued_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"Staged payload for {self.payload.get('vehicle_id')} at {self.received_at}"
+
+class FailedSensorPayload(models.Model):
+    """Sensor payloads that ingestion gave up on, kept so they can be replayed"""
+    payload = models.JSONField()
+    received_at = models.DateTimeField()
+    error = models.TextField()
+    failed_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Failed payload for {self.payload.get('vehicle_id')} at {self.received_at}"
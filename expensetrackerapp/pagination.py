@@ -0,0 +1,7 @@
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class ComplianceRecordPagination(LimitOffsetPagination):
+    """?limit=&offset= pages over a vehicle's compliance history"""
+    default_limit = 50
+    max_limit = 200
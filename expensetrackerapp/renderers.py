@@ -0,0 +1,26 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes compact responses with orjson when it is installed"""
+    
+    _encoder = JSONEncoder()
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        # Pretty-printed output (e.g. ?indent= or the browsable API) stays with json
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        ret = orjson.dumps(data, default=self._encoder.default, option=orjson.OPT_NON_STR_KEYS)
+        
+        # Escape U+2028/U+2029 like JSONRenderer so the output stays a javascript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -1,4 +1,7 @@
+from dataclasses import dataclass
+from typing import Optional
 from rest_framework import serializers
+from rest_framework.fields import empty
 from .models import TrafficSign, Vehicle, DrivingSession, ComplianceRecord, RewardToken
 
 class TrafficSignSerializer(serializers.ModelSerializer):
@@ -25,6 +28,22 @@ class ComplianceRecordSerializer(serializers.ModelSerializer):
         model = ComplianceRecord
         fields = '__all__'
 
+class CompactComplianceSerializer(serializers.ModelSerializer):
+    """Compliance record summary for dashboard lists"""
+    vehicle_id = serializers.CharField(source='vehicle.vehicle_id', read_only=True)
+    sign_type = serializers.CharField(source='traffic_sign.sign_type', read_only=True)
+    sign_value = serializers.CharField(source='traffic_sign.sign_value', read_only=True)
+    
+    class Meta:
+        model = ComplianceRecord
+        fields = ('id', 'vehicle_id', 'sign_type', 'sign_value', 'violation_type', 'severity', 'compliance_score', 'recorded_at')
+    
+    # Columns the fields above read, for .only() on the queryset
+    QUERY_FIELDS = (
+        'id', 'violation_type', 'severity', 'compliance_score', 'recorded_at',
+        'vehicle__vehicle_id', 'traffic_sign__sign_type', 'traffic_sign__sign_value'
+    )
+
 class RewardTokenSerializer(serializers.ModelSerializer):
     vehicle_id = serializers.CharField(source='vehicle.vehicle_id', read_only=True)
     
@@ -42,6 +61,74 @@ class SensorDataSerializer(serializers.Serializer):
     horn_applied = serializers.BooleanField(required=False, default=False)
     seatbelt_worn = serializers.BooleanField(required=False, default=False)
     location = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    
+    def validate(self, attrs):
+        if not sign_value_is_valid(attrs['sign_type'], attrs.get('sign_value')):
+            raise serializers.ValidationError({'sign_value': 'Speed limit value must be a number'})
+        return attrs
+
+def sign_value_is_valid(sign_type, sign_value):
+    """Whether ingestion can read the sign's value: speed limits must be whole numbers when given"""
+    if sign_type != 'speed_limit' or not sign_value:
+        return True
+    try:
+        int(sign_value)
+    except ValueError:
+        return False
+    return True
+
+@dataclass(frozen=True)
+class SensorData:
+    """Validated sensor payload, as parse_sensor or SensorDataSerializer produce it"""
+    vehicle_id: str
+    sign_type: str
+    sign_value: str = ''
+    actual_speed: Optional[int] = None
+    horn_applied: bool = False
+    seatbelt_worn: bool = False
+    location: str = ''
+
+# SensorDataSerializer's declared fields, read once for parse_sensor
+_SENSOR_FIELDS = tuple(SensorDataSerializer().fields.items())
+
+def parse_sensor(payload):
+    """
+    SensorData from a JSON payload that needs no coercion, checked against
+    SensorDataSerializer's fields without running it. Returns None when the
+    serializer has to decide (coercion, form data, invalid input)
+    """
+    if type(payload) is not dict:
+        return None
+    
+    values = {}
+    for name, field in _SENSOR_FIELDS:
+        if name not in payload:
+            if field.required:
+                return None
+            if field.default is not empty:
+                values[name] = field.default
+            continue
+        
+        value = payload[name]
+        if isinstance(field, serializers.CharField):
+            if (type(value) is not str or value != value.strip() or not value.isascii()
+                    or '\x00' in value or (not value and not field.allow_blank)
+                    or (field.max_length is not None and len(value) > field.max_length)):
+                return None
+        elif isinstance(field, serializers.BooleanField):
+            if type(value) is not bool:
+                return None
+        elif isinstance(field, serializers.IntegerField):
+            if type(value) is not int:
+                return None
+        else:
+            return None
+        values[name] = value
+    
+    # Left to the serializer so the 400 response names the field
+    if not sign_value_is_valid(values['sign_type'], values.get('sign_value')):
+        return None
+    return SensorData(**values)
 
 class ComplianceResponseSerializer(serializers.Serializer):
     """Serializer for compliance response"""
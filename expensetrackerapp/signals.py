@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .caching import invalidate_vehicle_pk
+from .models import Vehicle
+
+
+@receiver(post_delete, sender=Vehicle)
+def vehicle_deleted(sender, instance, **kwargs):
+    """A deleted vehicle's vehicle_id no longer maps to its pk"""
+    vehicle_id = instance.vehicle_id
+    transaction.on_commit(lambda: invalidate_vehicle_pk(vehicle_id))
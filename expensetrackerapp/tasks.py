@@ -0,0 +1,374 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from datetime import timedelta
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.utils import timezone
+from .models import (
+    assess_compliance, SEATBELT_REQUIRED_VEHICLE_TYPES, TrafficSign, Vehicle,
+    DrivingSession, ComplianceRecord, RewardToken, StagedSensorPayload, FailedSensorPayload
+)
+from .serializers import SensorData
+
+logger = logging.getLogger(__name__)
+
+# Sensor ingestion worker threads, and payloads each may have waiting. A vehicle's
+# payloads always go to the same worker, so within one process they are written
+# in arrival order. SQLite allows one writer at a time, so it gets a single worker
+INGEST_WORKERS = 4
+INGEST_QUEUE_SIZE = 1000
+
+# Payloads a worker writes per transaction, and seconds it waits for a batch to fill
+INGEST_BATCH_SIZE = 100
+INGEST_FLUSH_INTERVAL = 0.1
+
+# Attempts at a write that fails with OperationalError (e.g. SQLite's
+# "database is locked"), and seconds before the first retry, doubling after each
+INGEST_RETRIES = 5
+INGEST_RETRY_BACKOFF = 0.05
+
+# A vehicle seeing the same sign again within this window reuses its
+# TrafficSign row; each worker remembers up to RECENT_SIGNS_SIZE signs
+RECENT_SIGN_TTL = timedelta(seconds=60)
+RECENT_SIGNS_SIZE = 10000
+
+# Seconds a request waits for room in a full queue before giving up
+INGEST_ENQUEUE_TIMEOUT = 1
+
+# Every STAGED_SWEEP_INTERVAL seconds, staged payloads queued longer than
+# STAGED_PAYLOAD_TIMEOUT ago (e.g. by a process that has since restarted)
+# are queued again; writing claims and deletes the row, so each is written once
+STAGED_PAYLOAD_TIMEOUT = timedelta(seconds=60)
+STAGED_SWEEP_INTERVAL = 30
+
+_ingest_queues = []
+_ingest_start_lock = threading.Lock()
+
+
+def _write_sensor(data, received_at, recent_signs, new_signs):
+    """
+    Write one parsed sensor payload's rows inside the caller's transaction,
+    returning its compliance record and the tokens it earned. Signs this
+    vehicle saw within RECENT_SIGN_TTL are looked up in new_signs (created
+    in this transaction) then recent_signs (committed), and new ones are
+    added to new_signs
+    """
+    # Get or create vehicle, locking its row so concurrent payloads for the
+    # same vehicle apply their writes one after another. The vehicle almost
+    # always exists, so try a plain lookup before get_or_create's savepoint
+    try:
+        vehicle = Vehicle.objects.select_for_update().only('id', 'vehicle_type').get(vehicle_id=data.vehicle_id)
+    except Vehicle.DoesNotExist:
+        vehicle, created = Vehicle.objects.select_for_update().get_or_create(
+            vehicle_id=data.vehicle_id,
+            defaults={
+                'vehicle_type': 'four_wheeler',  # Default, can be updated later
+                'owner_name': 'Unknown'
+            }
+        )
+    
+    # Get or create active driving session; the one-active-session
+    # constraint turns a racing duplicate INSERT into a retried get
+    driving_session, created = DrivingSession.objects.get_or_create(
+        vehicle=vehicle,
+        is_active=True,
+        defaults={'session_start': received_at}
+    )
+    
+    # Reuse the traffic sign record if this vehicle just saw the same sign,
+    # otherwise create one
+    sign_key = (data.vehicle_id, data.sign_type, data.sign_value, data.location)
+    recent = new_signs.get(sign_key) or recent_signs.get(sign_key)
+    if recent and received_at - recent[1] < RECENT_SIGN_TTL:
+        traffic_sign = TrafficSign(
+            pk=recent[0],
+            sign_type=data.sign_type,
+            sign_value=data.sign_value,
+            location=data.location,
+            detected_at=recent[1]
+        )
+    else:
+        traffic_sign = TrafficSign.objects.create(
+            sign_type=data.sign_type,
+            sign_value=data.sign_value,
+            location=data.location,
+            detected_at=received_at
+        )
+        new_signs[sign_key] = (traffic_sign.pk, received_at)
+    
+    # Determine seatbelt requirement based on vehicle type
+    seatbelt_required = vehicle.vehicle_type in SEATBELT_REQUIRED_VEHICLE_TYPES
+    
+    # Score and classify the encounter up front, then insert the
+    # compliance record without save() scoring it again
+    speed_limit = int(data.sign_value) if data.sign_value and data.sign_type == 'speed_limit' else None
+    no_horn_zone = data.sign_type == 'no_horn'
+    compliance_score, violation_type, severity, violation_description = assess_compliance(
+        speed_limit, data.actual_speed, no_horn_zone,
+        data.horn_applied, seatbelt_required, data.seatbelt_worn
+    )
+    compliance_record = ComplianceRecord(
+        driving_session=driving_session,
+        vehicle=vehicle,
+        traffic_sign=traffic_sign,
+        speed_limit=speed_limit,
+        actual_speed=data.actual_speed,
+        no_horn_zone=no_horn_zone,
+        horn_applied=data.horn_applied,
+        seatbelt_required=seatbelt_required,
+        seatbelt_worn=data.seatbelt_worn,
+        violation_type=violation_type,
+        severity=severity,
+        violation_description=violation_description,
+        compliance_score=compliance_score,
+        recorded_at=received_at
+    )
+    compliance_record.save(force_insert=True, recalculate_score=False)
+    
+    # Calculate tokens earned (positive compliance = tokens)
+    tokens_earned = 0
+    if compliance_record.compliance_score >= 90:
+        tokens_earned = 5
+    elif compliance_record.compliance_score >= 80:
+        tokens_earned = 3
+    elif compliance_record.compliance_score >= 70:
+        tokens_earned = 1
+    
+    return compliance_record, tokens_earned
+
+
+def _remember_signs(recent_signs, new_signs):
+    """Add committed signs to recent_signs, dropping the least recently created past RECENT_SIGNS_SIZE"""
+    for sign_key, sign in new_signs.items():
+        recent_signs[sign_key] = sign
+        recent_signs.move_to_end(sign_key)
+    while len(recent_signs) > RECENT_SIGNS_SIZE:
+        recent_signs.popitem(last=False)
+
+
+def ingest_sensor_batch(batch, recent_signs=None):
+    """
+    Write (payload, received_at) pairs in one transaction, adding each
+    vehicle's earned tokens with a single upsert, and return
+    (compliance_record, tokens_earned) per payload. Pass a worker's
+    recent_signs OrderedDict to reuse signs across batches
+    """
+    results = []
+    earned_by_vehicle = {}
+    # Signs created in this transaction; only remembered once it commits
+    new_signs = {}
+    known_signs = recent_signs if recent_signs is not None else {}
+    with transaction.atomic():
+        for data, received_at in batch:
+            compliance_record, tokens_earned = _write_sensor(data, received_at, known_signs, new_signs)
+            vehicle_pk = compliance_record.vehicle_id
+            earned_by_vehicle[vehicle_pk] = earned_by_vehicle.get(vehicle_pk, 0) + tokens_earned
+            results.append((compliance_record, tokens_earned))
+        
+        RewardToken.add_tokens(earned_by_vehicle)
+        
+        # Runs only if the outermost transaction commits
+        if recent_signs is not None:
+            transaction.on_commit(lambda: _remember_signs(recent_signs, new_signs))
+    return results
+
+
+def ingest_sensor(data, received_at):
+    """Write one parsed sensor payload, returning its compliance record and the tokens it earned"""
+    return ingest_sensor_batch([(data, received_at)])[0]
+
+
+def _next_batch(work):
+    """Wait for a queued (staged pk, payload, received_at), then collect more for up to INGEST_FLUSH_INTERVAL"""
+    batch = [work.get()]
+    deadline = time.monotonic() + INGEST_FLUSH_INTERVAL
+    while len(batch) < INGEST_BATCH_SIZE:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(work.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _with_retries(write, *args, **kwargs):
+    """Run a write, retrying it with backoff while it fails with OperationalError"""
+    for attempt in range(INGEST_RETRIES):
+        try:
+            return write(*args, **kwargs)
+        except OperationalError:
+            if attempt == INGEST_RETRIES - 1:
+                raise
+            # Drop the connection if the error left it unusable
+            close_old_connections()
+            time.sleep(INGEST_RETRY_BACKOFF * 2 ** attempt)
+
+
+def _move_to_failed(staged_pk, data, received_at, error):
+    """Replace a staged payload with a FailedSensorPayload"""
+    with transaction.atomic():
+        FailedSensorPayload.objects.create(payload=asdict(data), received_at=received_at, error=str(error))
+        StagedSensorPayload.objects.filter(pk=staged_pk).delete()
+
+
+def _dead_letter(staged_pk, data, received_at, error):
+    """Keep a payload that could not be written as a FailedSensorPayload"""
+    logger.error(f"Sensor ingestion for {data.vehicle_id} failed: {error}")
+    try:
+        _with_retries(_move_to_failed, staged_pk, data, received_at, error)
+    except Exception as e:
+        # It stays staged, so the sweeper queues it again later
+        logger.critical(f"Could not store failed sensor payload {staged_pk} received at {received_at.isoformat()}: {e}")
+
+
+def ingest_staged_batch(batch, recent_signs=None):
+    """
+    Write queued (staged pk, payload, received_at) items and delete their
+    staged rows in one transaction. Items whose row is gone (already
+    written) or locked by another worker are skipped
+    """
+    with transaction.atomic():
+        claimed = set(
+            StagedSensorPayload.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=[staged_pk for staged_pk, data, received_at in batch])
+            .values_list('pk', flat=True)
+        )
+        if not claimed:
+            return
+        ingest_sensor_batch(
+            [(data, received_at) for staged_pk, data, received_at in batch if staged_pk in claimed],
+            recent_signs
+        )
+        StagedSensorPayload.objects.filter(pk__in=claimed).delete()
+
+
+def _write_batch(batch, recent_signs):
+    """Write a batch, retrying its payloads one by one if any of them fails"""
+    try:
+        _with_retries(ingest_staged_batch, batch, recent_signs)
+        return
+    except Exception as e:
+        if len(batch) == 1:
+            _dead_letter(*batch[0], e)
+            return
+    
+    # One bad payload rolled the whole batch back; write the rest on their own
+    for item in batch:
+        _write_batch([item], recent_signs)
+
+
+def replay_failed_sensors(failed_payloads):
+    """Write FailedSensorPayload rows again, deleting each one that succeeds; returns how many did"""
+    replayed = 0
+    for failed in failed_payloads:
+        try:
+            with transaction.atomic():
+                ingest_sensor(SensorData(**failed.payload), failed.received_at)
+                failed.delete()
+        except Exception as e:
+            logger.error(f"Replaying failed sensor payload {failed.pk} failed: {e}")
+            continue
+        replayed += 1
+    return replayed
+
+
+def _ingest_worker(work):
+    """Write queued sensor payloads in batches, forever"""
+    # This worker gets all of a vehicle's payloads, so it sees all of its repeat signs
+    recent_signs = OrderedDict()
+    while True:
+        batch = _next_batch(work)
+        # Workers outlive requests, so drop connections that have gone stale
+        close_old_connections()
+        try:
+            _write_batch(batch, recent_signs)
+        finally:
+            for _ in batch:
+                work.task_done()
+
+
+def _dead_letter_raw(staged, error):
+    """Replace a staged payload that no longer parses with a FailedSensorPayload"""
+    logger.error(f"Staged sensor payload {staged.pk} is invalid: {error}")
+    with transaction.atomic():
+        FailedSensorPayload.objects.create(payload=staged.payload, received_at=staged.received_at, error=str(error))
+        staged.delete()
+
+
+def requeue_stale_payloads(queues):
+    """Queue staged payloads again that were queued more than STAGED_PAYLOAD_TIMEOUT ago; returns how many"""
+    cutoff = timezone.now() - STAGED_PAYLOAD_TIMEOUT
+    stale = list(
+        StagedSensorPayload.objects.filter(queued_at__lt=cutoff)
+        .order_by('received_at', 'pk')[:INGEST_QUEUE_SIZE]
+    )
+    if not stale:
+        return 0
+    StagedSensorPayload.objects.filter(pk__in=[staged.pk for staged in stale]).update(queued_at=timezone.now())
+    
+    for staged in stale:
+        try:
+            data = SensorData(**staged.payload)
+        except TypeError as e:
+            _dead_letter_raw(staged, e)
+            continue
+        _queue_for(queues, data.vehicle_id).put((staged.pk, data, staged.received_at))
+    return len(stale)
+
+
+def _staged_sweeper(queues):
+    """Queue staged payloads left behind by a restart or a crashed worker, forever"""
+    while True:
+        close_old_connections()
+        try:
+            requeued = requeue_stale_payloads(queues)
+            if requeued:
+                logger.warning(f"Queued {requeued} stale staged sensor payloads again")
+        except Exception as e:
+            logger.error(f"Sweeping staged sensor payloads failed: {e}")
+        time.sleep(STAGED_SWEEP_INTERVAL)
+
+
+def _get_ingest_queues():
+    """The workers' queues, starting the worker and sweeper threads on first use"""
+    global _ingest_queues
+    if not _ingest_queues:
+        with _ingest_start_lock:
+            if not _ingest_queues:
+                workers = 1 if connection.vendor == 'sqlite' else INGEST_WORKERS
+                queues = [queue.Queue(maxsize=INGEST_QUEUE_SIZE) for _ in range(workers)]
+                for work in queues:
+                    threading.Thread(target=_ingest_worker, args=(work,), daemon=True).start()
+                threading.Thread(target=_staged_sweeper, args=(queues,), daemon=True).start()
+                _ingest_queues = queues
+    return _ingest_queues
+
+
+def _queue_for(queues, vehicle_id):
+    """The queue whose worker writes this vehicle's payloads"""
+    return queues[hash(vehicle_id) % len(queues)]
+
+
+def enqueue_sensor(data):
+    """
+    Stage a parsed sensor payload in the database, then queue it for writing;
+    raises queue.Full, dropping the staged row, if its worker stays backed up
+    """
+    received_at = timezone.now()
+    staged = _with_retries(
+        StagedSensorPayload.objects.create,
+        payload=asdict(data), received_at=received_at, queued_at=received_at
+    )
+    queues = _get_ingest_queues()
+    try:
+        _queue_for(queues, data.vehicle_id).put(
+            (staged.pk, data, received_at), timeout=INGEST_ENQUEUE_TIMEOUT
+        )
+    except queue.Full:
+        staged.delete()
+        raise
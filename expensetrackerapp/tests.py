@@ -1,3 +1,275 @@
-from django.test import TestCase
+import queue
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from . import tasks
+from .models import (
+    assess_compliance, ComplianceRecord, DrivingSession, FailedSensorPayload, RewardToken,
+    StagedSensorPayload, TrafficSign, Vehicle
+)
+from .serializers import SensorData, SensorDataSerializer, parse_sensor
+from .views import vehicle_pk_or_404
 
-# Create your tests here.
+# (speed_limit, actual_speed, no_horn_zone, horn_applied, seatbelt_required, seatbelt_worn)
+# -> (compliance_score, violation_type, severity, violation_description)
+ASSESS_CASES = [
+    ((40, 40, False, False, True, True), (100, 'no_violation', 'low', None)),
+    ((None, 90, False, False, False, False), (100, 'no_violation', 'low', None)),
+    ((40, 55, False, False, True, True), (80, 'speed_violation', 'medium', 'Speed 55 in a 40 zone')),
+    ((40, 61, False, False, True, True), (70, 'speed_violation', 'high', 'Speed 61 in a 40 zone')),
+    ((None, None, True, True, False, False), (85, 'horn_violation', 'low', 'Horn used in a no horn zone')),
+    ((None, None, False, False, True, False), (75, 'seatbelt_violation', 'high', 'Seatbelt not worn')),
+    # Several at once are critical and named after the heaviest penalty
+    ((40, 50, False, False, True, False), (55, 'seatbelt_violation', 'critical', 'Speed 50 in a 40 zone; Seatbelt not worn')),
+    ((40, 70, True, True, False, False), (55, 'speed_violation', 'critical', 'Speed 70 in a 40 zone; Horn used in a no horn zone')),
+    ((40, 70, True, True, True, False), (30, 'speed_violation', 'critical',
+                                         'Speed 70 in a 40 zone; Horn used in a no horn zone; Seatbelt not worn')),
+]
+
+
+class AssessComplianceTests(TestCase):
+    def test_score_and_classification_table(self):
+        for values, expected in ASSESS_CASES:
+            with self.subTest(values=values):
+                self.assertEqual(assess_compliance(*values), expected)
+
+
+class SensorValidationTests(TestCase):
+    def test_non_numeric_speed_limit_is_rejected(self):
+        with mock.patch('expensetrackerapp.views.enqueue_sensor') as enqueue:
+            response = APIClient().post('/et/sensor-data/', {
+                'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'sign_value': 'abc', 'actual_speed': 50
+            }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sign_value', response.json())
+        enqueue.assert_not_called()
+
+    def test_valid_payload_is_accepted(self):
+        with mock.patch('expensetrackerapp.views.enqueue_sensor') as enqueue:
+            response = APIClient().post('/et/sensor-data/', {
+                'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'sign_value': '40', 'actual_speed': 50
+            }, format='json')
+        self.assertEqual(response.status_code, 202)
+        enqueue.assert_called_once()
+
+    def test_parse_sensor_matches_serializer(self):
+        payloads = [
+            {'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'sign_value': '40', 'actual_speed': 50},
+            {'vehicle_id': 'V1', 'sign_type': 'no_horn', 'horn_applied': True, 'location': 'Main St'},
+            # Invalid: parse_sensor must hand these to the serializer, which rejects them
+            {'sign_type': 'speed_limit'},
+            {'vehicle_id': '', 'sign_type': 'speed_limit'},
+            {'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'sign_value': 'abc'},
+            {'vehicle_id': 'V1', 'sign_type': 'speed_limit', 'actual_speed': 'fast'},
+            {'vehicle_id': 'V1', 'sign_type': 'no_horn', 'horn_applied': 'maybe'},
+            {'vehicle_id': 'V1', 'sign_type': 'x' * 21},
+            ['not', 'a', 'dict'],
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                serializer = SensorDataSerializer(data=payload)
+                parsed = parse_sensor(payload)
+                if payload in payloads[:2]:
+                    self.assertTrue(serializer.is_valid())
+                    self.assertEqual(parsed, SensorData(**serializer.validated_data))
+                else:
+                    self.assertIsNone(parsed)
+                    self.assertFalse(serializer.is_valid())
+
+
+class RewardTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vehicle = Vehicle.objects.create(vehicle_id='V1', vehicle_type='four_wheeler')
+        self.other = Vehicle.objects.create(vehicle_id='V2', vehicle_type='four_wheeler')
+
+    def test_add_tokens_creates_then_accumulates(self):
+        RewardToken.add_tokens({self.vehicle.pk: 5})
+        RewardToken.add_tokens({self.vehicle.pk: 3, self.other.pk: 1})
+        self.assertEqual(
+            dict(RewardToken.objects.values_list('vehicle__vehicle_id', 'tokens_earned')),
+            {'V1': 8, 'V2': 1}
+        )
+
+    def test_overspend_is_rejected(self):
+        RewardToken.objects.create(vehicle=self.vehicle, tokens_earned=10, tokens_spent=4)
+        client = APIClient()
+
+        response = client.post('/et/vehicle/V1/spend-tokens/', {'tokens': 7}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(RewardToken.objects.get().tokens_spent, 4)
+
+        response = client.post('/et/vehicle/V1/spend-tokens/', {'tokens': 6}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RewardToken.objects.get().tokens_available, 0)
+
+
+class ComplianceRecordVehicleTests(TestCase):
+    def test_vehicle_always_follows_the_driving_session(self):
+        vehicle, other = (
+            Vehicle.objects.create(vehicle_id=vehicle_id, vehicle_type='four_wheeler')
+            for vehicle_id in ('V1', 'V2')
+        )
+        session = DrivingSession.objects.create(vehicle=vehicle)
+        sign = TrafficSign.objects.create(sign_type='no_horn')
+
+        record = ComplianceRecord.objects.create(driving_session=session, vehicle=other, traffic_sign=sign)
+        self.assertEqual(record.vehicle_id, vehicle.pk)
+
+        record.driving_session = DrivingSession.objects.create(vehicle=other, is_active=False)
+        record.save()
+        self.assertEqual(ComplianceRecord.objects.get().vehicle_id, other.pk)
+
+
+class VehiclePkCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_deleted_vehicle_is_not_served_from_cache(self):
+        vehicle = Vehicle.objects.create(vehicle_id='V1', vehicle_type='four_wheeler')
+        self.assertEqual(vehicle_pk_or_404('V1'), vehicle.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vehicle.delete()
+        with self.assertRaises(Http404):
+            vehicle_pk_or_404('V1')
+
+        recreated = Vehicle.objects.create(vehicle_id='V1', vehicle_type='four_wheeler')
+        self.assertEqual(vehicle_pk_or_404('V1'), recreated.pk)
+
+
+def stage(data, received_at):
+    """A queued item for data, staged the way enqueue_sensor does"""
+    staged = StagedSensorPayload.objects.create(payload=asdict(data), received_at=received_at)
+    return staged.pk, data, received_at
+
+
+class IngestRetryTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(tasks, 'INGEST_RETRY_BACKOFF', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def payload(self, vehicle_id='V1'):
+        return SensorData(vehicle_id=vehicle_id, sign_type='speed_limit', sign_value='40', actual_speed=50)
+
+    def test_locked_database_is_retried(self):
+        write = tasks.ingest_sensor_batch
+        calls = []
+
+        def locked_once(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return write(*args)
+
+        with mock.patch.object(tasks, 'ingest_sensor_batch', side_effect=locked_once):
+            tasks._write_batch([stage(self.payload(), timezone.now())], OrderedDict())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(ComplianceRecord.objects.count(), 1)
+        self.assertFalse(FailedSensorPayload.objects.exists())
+        self.assertFalse(StagedSensorPayload.objects.exists())
+
+    def test_failing_payload_is_dead_lettered_and_others_written(self):
+        received_at = timezone.now()
+        bad = SensorData(vehicle_id='V2', sign_type='speed_limit', sign_value='abc')
+        tasks._write_batch([stage(self.payload(), received_at), stage(bad, received_at)], OrderedDict())
+
+        self.assertEqual(ComplianceRecord.objects.count(), 1)
+        failed = FailedSensorPayload.objects.get()
+        self.assertEqual(failed.payload['vehicle_id'], 'V2')
+        self.assertEqual(failed.received_at, received_at)
+        self.assertFalse(StagedSensorPayload.objects.exists())
+
+    def test_payload_already_written_is_skipped(self):
+        item = stage(self.payload(), timezone.now())
+        tasks._write_batch([item], OrderedDict())
+        # Queued again by the sweeper after its row was written and deleted
+        tasks._write_batch([item], OrderedDict())
+        self.assertEqual(ComplianceRecord.objects.count(), 1)
+
+    def test_replay_writes_and_deletes_failed_payloads(self):
+        FailedSensorPayload.objects.create(
+            payload={'vehicle_id': 'V3', 'sign_type': 'no_horn', 'horn_applied': True, 'seatbelt_worn': True},
+            received_at=timezone.now(), error='database is locked'
+        )
+        self.assertEqual(tasks.replay_failed_sensors(FailedSensorPayload.objects.all()), 1)
+        self.assertFalse(FailedSensorPayload.objects.exists())
+        self.assertEqual(ComplianceRecord.objects.get().violation_type, 'horn_violation')
+
+
+class StagedPayloadTests(TestCase):
+    def payload(self):
+        return SensorData(vehicle_id='V1', sign_type='no_horn', horn_applied=True, seatbelt_worn=True)
+
+    def test_accepted_payload_is_staged_before_queueing(self):
+        work = queue.Queue(maxsize=1)
+        with mock.patch.object(tasks, '_get_ingest_queues', return_value=[work]):
+            tasks.enqueue_sensor(self.payload())
+            staged_pk, data, received_at = work.get_nowait()
+            self.assertEqual(StagedSensorPayload.objects.get(pk=staged_pk).payload, asdict(data))
+
+            # A full queue rejects the payload without leaving it staged
+            work.put(None)
+            with mock.patch.object(tasks, 'INGEST_ENQUEUE_TIMEOUT', 0):
+                with self.assertRaises(queue.Full):
+                    tasks.enqueue_sensor(self.payload())
+        self.assertEqual(StagedSensorPayload.objects.count(), 1)
+
+    def test_stale_staged_payloads_are_queued_again(self):
+        now = timezone.now()
+        old = StagedSensorPayload.objects.create(
+            payload=asdict(self.payload()), received_at=now, queued_at=now - timedelta(minutes=5)
+        )
+        StagedSensorPayload.objects.create(payload=asdict(self.payload()), received_at=now, queued_at=now)
+        work = queue.Queue()
+
+        self.assertEqual(tasks.requeue_stale_payloads([work]), 1)
+        self.assertEqual(work.get_nowait(), (old.pk, self.payload(), now))
+        # Not queued again until it goes stale once more
+        self.assertEqual(tasks.requeue_stale_payloads([work]), 0)
+
+        tasks._write_batch([(old.pk, self.payload(), now)], OrderedDict())
+        self.assertEqual(ComplianceRecord.objects.get().violation_type, 'horn_violation')
+        self.assertEqual(StagedSensorPayload.objects.count(), 1)
+
+
+class ConcurrentIngestTests(TransactionTestCase):
+    def test_concurrent_batches_for_two_vehicles_both_land(self):
+        received_at = timezone.now()
+        start = threading.Barrier(2)
+
+        def write(batch):
+            start.wait()
+            try:
+                tasks._write_batch(batch, OrderedDict())
+            finally:
+                connection.close()
+
+        batches = []
+        for vehicle_id in ('V1', 'V2'):
+            payload = SensorData(
+                vehicle_id=vehicle_id, sign_type='speed_limit', sign_value='40',
+                actual_speed=50, seatbelt_worn=True
+            )
+            batches.append([stage(payload, received_at) for _ in range(3)])
+        threads = [threading.Thread(target=write, args=(batch,)) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(FailedSensorPayload.objects.exists())
+        self.assertFalse(StagedSensorPayload.objects.exists())
+        for vehicle_id in ('V1', 'V2'):
+            self.assertEqual(ComplianceRecord.objects.filter(vehicle__vehicle_id=vehicle_id).count(), 3)
+            # Three records scoring 80 earn 3 tokens each
+            self.assertEqual(RewardToken.objects.get(vehicle__vehicle_id=vehicle_id).tokens_earned, 9)
@@ -1,15 +1,34 @@
+import queue
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.http import Http404
 from django.utils import timezone
-from .models import TrafficSign, Vehicle, DrivingSession, ComplianceRecord, RewardToken
+from .models import COUNTED_VIOLATION_TYPES, Vehicle, ComplianceRecord, RewardToken
 from .serializers import (
     TrafficSignSerializer, VehicleSerializer, DrivingSessionSerializer,
     ComplianceRecordSerializer, RewardTokenSerializer, SensorDataSerializer,
-    ComplianceResponseSerializer
+    ComplianceResponseSerializer, CompactComplianceSerializer, SensorData, parse_sensor
 )
+from .caching import VEHICLE_PK_CACHE_TIMEOUT, vehicle_pk_cache_key
+from .pagination import ComplianceRecordPagination
+from .renderers import ORJSONRenderer
+from .tasks import enqueue_sensor
+
+def vehicle_pk_or_404(vehicle_id):
+    """Primary key of the vehicle with this vehicle_id, cached between requests"""
+    try:
+        return cache.get_or_set(
+            vehicle_pk_cache_key(vehicle_id),
+            lambda: Vehicle.objects.values_list('pk', flat=True).get(vehicle_id=vehicle_id),
+            VEHICLE_PK_CACHE_TIMEOUT
+        )
+    except Vehicle.DoesNotExist:
+        raise Http404('No Vehicle matches the given query.')
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -17,103 +36,49 @@ def process_sensor_data(request):
     """
     Process incoming sensor data and create compliance records
     """
-    serializer = SensorDataSerializer(data=request.data)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    data = serializer.validated_data
+    # Well-formed JSON is parsed directly; anything else goes through the
+    # serializer, which also produces the error response
+    data = parse_sensor(request.data)
+    if data is None:
+        serializer = SensorDataSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = SensorData(**serializer.validated_data)
     
     try:
-        # Get or create vehicle
-        vehicle, created = Vehicle.objects.get_or_create(
-            vehicle_id=data['vehicle_id'],
-            defaults={
-                'vehicle_type': 'four_wheeler',  # Default, can be updated later
-                'owner_name': 'Unknown'
-            }
-        )
-        
-        # Get or create active driving session
-        driving_session, created = DrivingSession.objects.get_or_create(
-            vehicle=vehicle,
-            is_active=True,
-            defaults={'session_start': timezone.now()}
-        )
-        
-        # Create traffic sign record
-        traffic_sign = TrafficSign.objects.create(
-            sign_type=data['sign_type'],
-            sign_value=data.get('sign_value', ''),
-            location=data.get('location', ''),
-            detected_at=timezone.now()
-        )
-        
-        # Determine seatbelt requirement based on vehicle type
-        seatbelt_required = vehicle.vehicle_type == 'four_wheeler'
-        
-        # Create compliance record
-        compliance_record = ComplianceRecord.objects.create(
-            driving_session=driving_session,
-            traffic_sign=traffic_sign,
-            speed_limit=int(data.get('sign_value', 0)) if data.get('sign_value') and data['sign_type'] == 'speed_limit' else None,
-            actual_speed=data.get('actual_speed'),
-            no_horn_zone=data['sign_type'] == 'no_horn',
-            horn_applied=data.get('horn_applied', False),
-            seatbelt_required=seatbelt_required,
-            seatbelt_worn=data.get('seatbelt_worn', False),
-            recorded_at=timezone.now()
-        )
-        
-        # Calculate tokens earned (positive compliance = tokens)
-        tokens_earned = 0
-        if compliance_record.compliance_score >= 90:
-            tokens_earned = 5
-        elif compliance_record.compliance_score >= 80:
-            tokens_earned = 3
-        elif compliance_record.compliance_score >= 70:
-            tokens_earned = 1
-        
-        # Update reward tokens
-        reward_token, created = RewardToken.objects.get_or_create(
-            vehicle=vehicle,
-            defaults={'tokens_earned': tokens_earned}
+        # The payload is staged in the database and written by an ingestion
+        # worker, so sensors don't wait for the full write
+        enqueue_sensor(data)
+    except queue.Full:
+        return Response(
+            {'error': 'Sensor data queue is full, retry later'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
         )
-        if not created:
-            reward_token.tokens_earned += tokens_earned
-            reward_token.save()
-        
-        # Prepare response
-        response_data = {
-            'compliance_record_id': compliance_record.id,
-            'violation_type': compliance_record.violation_type,
-            'severity': compliance_record.severity,
-            'compliance_score': compliance_record.compliance_score,
-            'violation_description': compliance_record.violation_description or 'No violations detected',
-            'tokens_earned': tokens_earned
-        }
-        
-        return Response(response_data, status=status.HTTP_201_CREATED)
-        
     except Exception as e:
         return Response(
             {'error': f'Failed to process sensor data: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    
+    return Response({'accepted': True}, status=status.HTTP_202_ACCEPTED)
 
 @api_view(['GET'])
+@renderer_classes([ORJSONRenderer, BrowsableAPIRenderer])
 @permission_classes([AllowAny])
 def get_vehicle_compliance(request, vehicle_id):
     """
     Get compliance history for a specific vehicle
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
+        vehicle_pk = vehicle_pk_or_404(vehicle_id)
         compliance_records = ComplianceRecord.objects.filter(
-            driving_session__vehicle=vehicle
-        ).order_by('-recorded_at')
+            vehicle_id=vehicle_pk
+        ).select_related('vehicle', 'traffic_sign').order_by('-recorded_at', '-id')
         
-        serializer = ComplianceRecordSerializer(compliance_records, many=True)
-        return Response(serializer.data)
+        paginator = ComplianceRecordPagination()
+        page = paginator.paginate_queryset(compliance_records, request)
+        serializer = ComplianceRecordSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
         
     except Exception as e:
         return Response(
@@ -128,9 +93,9 @@ def get_reward_tokens(request, vehicle_id):
     Get reward tokens for a specific vehicle
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
-        reward_token, created = RewardToken.objects.get_or_create(
-            vehicle=vehicle,
+        vehicle_pk = vehicle_pk_or_404(vehicle_id)
+        reward_token, created = RewardToken.objects.select_related('vehicle').get_or_create(
+            vehicle_id=vehicle_pk,
             defaults={'tokens_earned': 0, 'tokens_spent': 0}
         )
         
@@ -150,19 +115,26 @@ def spend_tokens(request, vehicle_id):
     Spend tokens for rewards
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
-        reward_token = get_object_or_404(RewardToken, vehicle=vehicle)
+        vehicle_pk = vehicle_pk_or_404(vehicle_id)
         
         tokens_to_spend = request.data.get('tokens', 0)
-        if tokens_to_spend > reward_token.tokens_available:
+        
+        # Check the balance and spend in a single UPDATE so concurrent requests
+        # can't both spend the same tokens
+        updated = RewardToken.objects.filter(
+            vehicle_id=vehicle_pk,
+            tokens_earned__gte=F('tokens_spent') + tokens_to_spend
+        ).update(
+            tokens_spent=F('tokens_spent') + tokens_to_spend,
+            last_updated=timezone.now()
+        )
+        if not updated:
             return Response(
                 {'error': 'Insufficient tokens available'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        reward_token.tokens_spent += tokens_to_spend
-        reward_token.save()
-        
+        reward_token = RewardToken.objects.select_related('vehicle').get(vehicle_id=vehicle_pk)
         serializer = RewardTokenSerializer(reward_token)
         return Response(serializer.data)
         
@@ -173,34 +145,36 @@ def spend_tokens(request, vehicle_id):
         )
 
 @api_view(['GET'])
+@renderer_classes([ORJSONRenderer, BrowsableAPIRenderer])
 @permission_classes([AllowAny])
 def get_dashboard_stats(request, vehicle_id):
     """
     Get dashboard statistics for a vehicle
     """
     try:
-        vehicle = get_object_or_404(Vehicle, vehicle_id=vehicle_id)
-        
-        # Get recent compliance records
-        recent_records = ComplianceRecord.objects.filter(
-            driving_session__vehicle=vehicle
-        ).order_by('-recorded_at')[:10]
+        vehicle_pk = vehicle_pk_or_404(vehicle_id)
         
-        # Calculate statistics
-        total_records = ComplianceRecord.objects.filter(
-            driving_session__vehicle=vehicle
-        ).count()
+        vehicle_records = ComplianceRecord.objects.filter(vehicle_id=vehicle_pk)
         
-        violations = ComplianceRecord.objects.filter(
-            driving_session__vehicle=vehicle,
-            violation_type__in=['speed_violation', 'horn_violation', 'seatbelt_violation']
-        ).count()
+        # Get recent compliance records
+        recent_records = vehicle_records.select_related(
+            'vehicle', 'traffic_sign'
+        ).only(*CompactComplianceSerializer.QUERY_FIELDS).order_by('-recorded_at')[:10]
+        
+        # Calculate statistics in a single pass
+        counts = vehicle_records.aggregate(
+            total=Count('id'),
+            violations=Count('id', filter=Q(violation_type__in=COUNTED_VIOLATION_TYPES))
+        )
+        total_records, violations = counts['total'], counts['violations']
         
         compliance_rate = ((total_records - violations) / total_records * 100) if total_records > 0 else 100
         
         # Get reward tokens
-        reward_token, created = RewardToken.objects.get_or_create(
-            vehicle=vehicle,
+        reward_token, created = RewardToken.objects.only(
+            'tokens_earned', 'tokens_spent', 'vehicle_id'
+        ).get_or_create(
+            vehicle_id=vehicle_pk,
             defaults={'tokens_earned': 0, 'tokens_spent': 0}
         )
         
@@ -209,7 +183,7 @@ def get_dashboard_stats(request, vehicle_id):
             'compliance_rate': round(compliance_rate, 2),
             'violations': violations,
             'tokens_available': reward_token.tokens_available,
-            'recent_records': ComplianceRecordSerializer(recent_records, many=True).data
+            'recent_records': CompactComplianceSerializer(recent_records, many=True).data
         }
         
         return Response(stats)